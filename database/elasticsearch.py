@@ -1,17 +1,17 @@
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
-from elasticsearch import Elasticsearch
-
+from utils.clients import ClientRegistry
 from utils.configmanager import ConfigManager
 
 # db_config = ConfigManager.get_config_value("database", "elasticsearch")
 # es = Elasticsearch(db_config["hosts"])
 
 
-def make_es(retries=30, db_config=ConfigManager.get_config_value("database", "elasticsearch")):
+def make_es(retries=30, db_config=None):
+    db_config = db_config or ConfigManager.get_config_value("database", "elasticsearch")
     while retries != 0:
         try:
-            es = Elasticsearch(db_config["hosts"])
+            es = ClientRegistry.elasticsearch("elasticsearch", db_config)
             init_es(es)
             return es
         except:
@@ -22,7 +22,8 @@ def make_es(retries=30, db_config=ConfigManager.get_config_value("database", "el
             retries -= 1
 
 
-def init_es(es, indices=ConfigManager.get_config_value("search", "indices")):
+def init_es(es, indices=None):
+    indices = indices if indices is not None else ConfigManager.get_config_value("search", "indices")
     for index in indices:
         if not es.indices.exists(index):
             es.indices.create(index)
@@ -1,13 +1,13 @@
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
-from pymongo import MongoClient
-
+from utils.clients import ClientRegistry
 from utils.configmanager import ConfigManager
-from utils.common import make_url
+from utils.lazy import LazyProxy
 
 
-def make_db(db_config=ConfigManager.get_config_value("database", "mongo")):
-    return MongoClient(make_url(db_config, include_db=False), connect=False)[db_config["db"]]
+def make_db(db_config=None):
+    db_config = db_config or ConfigManager.get_config_value("database", "mongo")
+    return ClientRegistry.mongo("mongo", db_config)[db_config["db"]]
 
 
-db = make_db()
+db = LazyProxy(make_db)
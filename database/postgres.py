@@ -4,9 +4,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 
 from utils.configmanager import ConfigManager
-from utils.common import make_url
 
 
-db_config = ConfigManager.get_config_value("database", "postgres")
 db = SQLAlchemy()  # Initialize SQLAlchemy before Marshmallow
 ma = Marshmallow()
+
+
+def __getattr__(name):
+    # db_config is only read when it's used, importing the models doesn't need the config
+    if name == "db_config":
+        return ConfigManager.get_config_value("database", "postgres")
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
@@ -0,0 +1,145 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import asyncio
+import inspect
+import traceback
+
+from events.index import StreamIndexConfig, add_index_writes, add_stale_reads, add_trim_writes
+from events.redisstream import event_to_fields, route_item, plan_batch
+from utils.clients import ClientRegistry
+from utils.common import uuid_factory
+from utils.configmanager import ConfigManager
+
+DEFAULT_CONCURRENCY = 16
+
+
+class AsyncRedisStream:
+    __broker = None
+
+    @classmethod
+    def get_broker(cls):
+        if not cls.__broker:
+            redis_config = ConfigManager.get_config_value("events-stream", "broker")
+            cls.__broker = ClientRegistry.async_redis("events-stream-async", redis_config)
+        return cls.__broker
+
+
+async def produce_one(name, event, maxlen=10000, approximate=True):
+    ids = await produce_many(name, [event], maxlen=maxlen, approximate=approximate)
+    return ids[0]
+
+
+async def produce_many(name, events, maxlen=10000, approximate=True):
+    if not events:
+        return []
+    r = AsyncRedisStream.get_broker()
+    # Encoding and claim-check uploads block, they run in a thread to keep the event loop free
+    fields = await asyncio.to_thread(lambda: [event_to_fields(event) for event in events])
+    pipe = r.pipeline(transaction=False)
+    for event_fields in fields:
+        pipe.xadd(name, event_fields, maxlen=maxlen, approximate=approximate)
+    ids = await pipe.execute()
+    if StreamIndexConfig.indexed_paths(name):
+        pipe = r.pipeline(transaction=False)
+        add_index_writes(pipe, name, events, ids)
+        await pipe.execute()
+        if StreamIndexConfig.count_writes(name, len(events)):
+            await trim_index(r, name)
+    return ids
+
+
+async def trim_index(broker, stream_name):
+    pipe = broker.pipeline(transaction=False)
+    paths = add_stale_reads(pipe, stream_name, await broker.xrange(stream_name, count=1))
+    if not paths:
+        return 0
+    pipe, stale_values = broker.pipeline(transaction=False), await pipe.execute()
+    removed = add_trim_writes(pipe, stream_name, paths, stale_values)
+    if removed:
+        await pipe.execute()
+    return removed
+
+
+async def maybe_create_consumer_groups(broker, consumer_groups_config):
+    group_name = consumer_groups_config["name"]
+    for stream in consumer_groups_config["streams"]:
+        groups = await broker.xinfo_groups(stream) if await broker.exists(stream) else []
+        if not any([group_name == group["name"].decode("utf-8") for group in groups]):
+            try:
+                await broker.xgroup_create(stream, group_name, mkstream=True)
+                print(f"Consumer group '{group_name}' created for stream {stream}")
+            except:
+                pass  # Not pretty, but handles the issue of a race for creating a CG
+
+
+async def call_handler(handler, *args, **kwargs):
+    try:
+        if inspect.iscoroutinefunction(handler):
+            await handler(*args, **kwargs)
+        else:
+            await asyncio.to_thread(handler, *args, **kwargs)
+        return True
+    except Exception:
+        print(f"Handler {getattr(handler, '__name__', handler)} failed")
+        traceback.print_exc()
+        return False
+
+
+async def digest(semaphore, acks, stream_name, event_ids, handler, *args, **kwargs):
+    async with semaphore:
+        if await call_handler(handler, *args, **kwargs):
+            acks.setdefault(stream_name, []).extend(event_ids)
+
+
+def schedule_batch(semaphore, acks, stream_name, events, event_ids, registered_handlers, args={}):
+    ignored, jobs = plan_batch(events, event_ids, registered_handlers)
+    if ignored:
+        acks.setdefault(stream_name, []).extend(ignored)
+    tasks = []
+    for handler, event, event_id, ack_ids in jobs:
+        coro = digest(semaphore, acks, stream_name, ack_ids, handler, stream_name, event, event_id, **args)
+        tasks.append(asyncio.create_task(coro))
+    return tasks
+
+
+async def ack_batch(broker, group_name, acks):
+    pipe = broker.pipeline(transaction=False)
+    for stream_name, event_ids in acks.items():
+        if event_ids:
+            pipe.xack(stream_name, group_name, *event_ids)
+    return await pipe.execute()
+
+
+async def start_redis_consumer(consumer_group_config, registered_handlers, start_from=">"):
+    broker = AsyncRedisStream.get_broker()
+    streams_dict = {s: start_from for s in consumer_group_config["streams"]}
+    await maybe_create_consumer_groups(broker, consumer_group_config)
+
+    group_name = consumer_group_config["name"]
+    consumer_name = uuid_factory(group_name + "-consumer")()
+    batch_size = consumer_group_config["batch_size"]
+    concurrency = consumer_group_config.get("concurrency", DEFAULT_CONCURRENCY)
+    max_in_flight = consumer_group_config.get("max_in_flight", concurrency * 2)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    in_flight = set()
+    acks = {}
+    while True:
+        if len(in_flight) >= max_in_flight:
+            _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        count = min(batch_size, max_in_flight - len(in_flight))
+        block = 100 if in_flight else 1000  # Come back soon to ack events whose handlers finished
+        items = await broker.xreadgroup(group_name, consumer_name, streams_dict, count=count, block=block)
+        for item in items or []:
+            # Decoding and claim-check downloads block, like sync handlers they run in a thread
+            stream_name, unhandled, event_ids, events = await asyncio.to_thread(
+                route_item, item, registered_handlers
+            )
+            acks.setdefault(stream_name, []).extend(unhandled)
+            tasks = schedule_batch(semaphore, acks, stream_name, events, event_ids, registered_handlers)
+            in_flight.update(tasks)
+        in_flight = {task for task in in_flight if not task.done()}
+        if acks:
+            done = dict(acks)
+            acks.clear()  # Running tasks keep appending to this same dict
+            await ack_batch(broker, group_name, done)
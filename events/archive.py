@@ -0,0 +1,281 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import io
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from events.claimcheck import STORES
+from events.recovery import sweep_pending, DEFAULT_INTERVAL as DEFAULT_SWEEP_INTERVAL
+from events.redisstream import (
+    RedisStream,
+    ack_batch,
+    bytes_to_event,
+    event_from_dict,
+    maybe_create_consumer_groups,
+)
+from utils.configmanager import ConfigManager
+
+# Archived events are written as Parquet files partitioned like <prefix>date=YYYY-MM-DD/event_type=NAME/.
+# Besides the encoded event, every row keeps its scalar fields flattened into columns
+# ("correlations.stream_id", "detections.score", ...) so they can be filtered without decoding payloads.
+DEFAULT_PREFIX = "archive/"
+DEFAULT_LOCAL_PATH = "/tmp/archive"
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_MAX_DELAY = 60
+DEFAULT_COMPRESSION = "zstd"
+RETRY_DELAY = 5  # Seconds before retrying a batch the store failed to write
+MAX_FLATTEN_DEPTH = 3
+SCALARS = (str, int, float, bool)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Archiving events requires pyarrow, pip install pyarrow") from e
+    return pyarrow
+
+
+def _str(s):
+    return s.decode("utf-8") if isinstance(s, bytes) else s
+
+
+class ArchiveConfig:
+    __config = None
+
+    @classmethod
+    def get_config(cls):
+        if cls.__config is None:
+            stream_config = ConfigManager.get_config_value("events-stream")
+            cls.__config = stream_config.get("archive") or {}
+        return cls.__config
+
+    @classmethod
+    def set_config(cls, config):
+        cls.__config = config
+
+
+def get_store(config):
+    store_config = dict(config)
+    store_config.setdefault("path", DEFAULT_LOCAL_PATH)
+    return STORES[config.get("store", "local")](store_config)
+
+
+def flatten(state, prefix="", depth=0, row=None):
+    row = {} if row is None else row
+    for name, value in state.items():
+        if not isinstance(name, str) or name.startswith("_"):
+            continue  # Claim checks and other private state only live in the payload
+        if isinstance(value, SCALARS):
+            row[prefix + name] = value
+        elif isinstance(value, dict) and depth < MAX_FLATTEN_DEPTH:
+            flatten(value, f"{prefix}{name}.", depth + 1, row)
+    return row
+
+
+def event_row(stream_name, event_id, event, payload):
+    row = {
+        "stream": _str(stream_name),
+        "event_id": _str(event_id),
+        "uuid": event.uuid,
+        "event_type": getattr(event.event_type, "name", str(event.event_type)),
+        "timestamp": event.timestamp,
+        "payload": payload,
+    }
+    fields = flatten(vars(event))
+    for name in ("uuid", "event_type", "timestamp"):
+        fields.pop(name, None)
+    row.update((name, value) for name, value in fields.items() if name not in row)
+    return row
+
+
+def partition(row):
+    date = datetime.fromtimestamp(row["timestamp"] or 0, timezone.utc).strftime("%Y-%m-%d")
+    return date, row["event_type"]
+
+
+def partition_prefix(prefix, date, event_type):
+    return f"{prefix}date={date}/event_type={event_type}/"
+
+
+def rows_to_table(rows):
+    pa = _pyarrow()
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    columns = []
+    for name in names:
+        values = [row.get(name) for row in rows]
+        try:
+            columns.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed types across events, keep the column filterable as text
+            columns.append(pa.array([None if v is None else str(v) for v in values], pa.string()))
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def table_to_bytes(table, compression=DEFAULT_COMPRESSION):
+    pa = _pyarrow()
+    sink = io.BytesIO()
+    pa.parquet.write_table(table, sink, compression=compression)
+    return sink.getvalue()
+
+
+def write_rows(store, rows, prefix=DEFAULT_PREFIX, compression=DEFAULT_COMPRESSION):
+    partitions = {}
+    for row in rows:
+        partitions.setdefault(partition(row), []).append(row)
+    keys = []
+    for (date, event_type), partition_rows in partitions.items():
+        first, last = partition_rows[0], partition_rows[-1]
+        filename = f"{first['stream']}-{first['event_id']}-{last['event_id']}.parquet"
+        key = partition_prefix(prefix, date, event_type) + filename
+        keys.append(store.put(key, table_to_bytes(rows_to_table(partition_rows), compression)))
+    return keys
+
+
+class StreamArchiver:
+    def __init__(self, config=None):
+        self.config = ArchiveConfig.get_config() if config is None else config
+        self.store = get_store(self.config)
+        self.prefix = self.config.get("prefix", DEFAULT_PREFIX)
+        self.compression = self.config.get("compression", DEFAULT_COMPRESSION)
+        self.batch_size = self.config.get("batch_size", DEFAULT_BATCH_SIZE)
+        self.max_delay = self.config.get("max_delay", DEFAULT_MAX_DELAY)
+        self.rows = []
+        self.acks = {}
+        self.first_added = None
+
+    def add_item(self, item):
+        stream_name, entries = item
+        for event_id, event_dict in entries:
+            if not event_dict:
+                continue
+            try:
+                payload = event_from_dict(event_dict)
+                row = event_row(stream_name, event_id, bytes_to_event(payload), payload)
+            except Exception:
+                # Left unacked: retried when the archiver restarts or by the recovery sweep, if configured
+                print(f"Can't archive event {event_id} from {stream_name}")
+                traceback.print_exc()
+                continue
+            self.rows.append(row)
+            self.acks.setdefault(stream_name, []).append(event_id)
+        if self.rows and self.first_added is None:
+            self.first_added = time.time()
+
+    def should_flush(self):
+        if not self.rows:
+            return False
+        return len(self.rows) >= self.batch_size or time.time() - self.first_added >= self.max_delay
+
+    def flush(self):
+        # Events are only acked once their file is stored, if the store fails they stay buffered
+        if not self.rows:
+            return {}
+        keys = write_rows(self.store, self.rows, self.prefix, self.compression)
+        print(f"Archived {len(self.rows)} events to {len(keys)} files")
+        acks = self.acks
+        self.rows, self.acks, self.first_added = [], {}, None
+        return acks
+
+    def buffered_ids(self):
+        ids = {}
+        for stream_name, event_ids in self.acks.items():  # Read entries have bytes names, swept ones str
+            ids.setdefault(_str(stream_name), []).extend(event_ids)
+        return ids
+
+
+def start_archiver(consumer_group_config, archive_config=None, consumer_name=None):
+    # The consumer name is stable, so a restarted archiver first archives what it left pending.
+    # Archivers running side by side on the same group need distinct names.
+    broker = RedisStream.get_broker()
+    maybe_create_consumer_groups(broker, consumer_group_config)
+    streams_dict = {s: "0" for s in consumer_group_config["streams"]}  # Own pending entries first
+
+    group_name = consumer_group_config["name"]
+    consumer_name = consumer_name or group_name + "-archiver"
+    recovery_config = consumer_group_config.get("recovery")
+    next_sweep = time.time()
+    archiver = StreamArchiver(archive_config)
+    while True:
+        items = []
+        count = min(consumer_group_config["batch_size"], archiver.batch_size - len(archiver.rows))
+        if count > 0:
+            items = broker.xreadgroup(group_name, consumer_name, streams_dict, count=count, block=1000) or []
+        for stream_name, entries in items:
+            if streams_dict[_str(stream_name)] != ">":
+                # Reading pending entries, move past them or on to new ones once they are all read
+                streams_dict[_str(stream_name)] = entries[-1][0] if entries else ">"
+        if recovery_config and time.time() >= next_sweep:
+            items += sweep_pending(broker, consumer_group_config, consumer_name, archiver.buffered_ids())
+            next_sweep = time.time() + recovery_config.get("interval", DEFAULT_SWEEP_INTERVAL)
+        [archiver.add_item(item) for item in items]
+        if archiver.should_flush():
+            try:
+                ack_batch(broker, group_name, archiver.flush())
+            except Exception:
+                print(f"Can't archive {len(archiver.rows)} events, retrying in {RETRY_DELAY}s")
+                traceback.print_exc()
+                time.sleep(RETRY_DELAY)
+
+
+def dates_between(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
+
+
+class ArchiveReader:
+    def __init__(self, config=None):
+        self.config = ArchiveConfig.get_config() if config is None else config
+        self.store = get_store(self.config)
+        self.prefix = self.config.get("prefix", DEFAULT_PREFIX)
+
+    def keys(self, start_date, end_date=None, event_types=None):
+        # Partitions are picked from the key layout, files outside the range are never downloaded
+        end_date = end_date or start_date
+        for date in dates_between(start_date, end_date):
+            if event_types:
+                prefixes = [partition_prefix(self.prefix, date, t) for t in event_types]
+            else:
+                prefixes = [f"{self.prefix}date={date}/"]
+            for prefix in prefixes:
+                yield from (key for key in self.store.list(prefix) if key.endswith(".parquet"))
+
+    def read_file(self, key, filters_dict={}, columns=None):
+        pa = _pyarrow()
+        parquet_file = pa.parquet.ParquetFile(pa.BufferReader(self.store.get(key)))
+        names = parquet_file.schema_arrow.names
+        if any(name not in names for name in filters_dict):
+            return None  # No event in the file has the field
+        if columns is not None:
+            columns = [c for c in dict.fromkeys(list(columns) + list(filters_dict)) if c in names]
+        table = parquet_file.read(columns=columns)
+        if filters_dict:
+            mask = None
+            for name, value in filters_dict.items():
+                condition = pa.compute.equal(table[name], value)
+                mask = condition if mask is None else pa.compute.and_(mask, condition)
+            table = table.filter(mask)
+        return table
+
+    def read_table(self, start_date, end_date=None, event_types=None, filters_dict={}, columns=None):
+        # Only the requested columns are read, leave "payload" out unless the events are needed
+        pa = _pyarrow()
+        tables = []
+        for key in self.keys(start_date, end_date, event_types):
+            table = self.read_file(key, filters_dict, columns)
+            if table is not None and table.num_rows:
+                tables.append(table)
+        if not tables:
+            return None
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    def read_events(self, start_date, end_date=None, event_types=None, filters_dict={}):
+        table = self.read_table(start_date, end_date, event_types, filters_dict, columns=["payload"])
+        if table is None:
+            return []
+        return [bytes_to_event(payload) for payload in table.column("payload").to_pylist()]
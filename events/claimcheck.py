@@ -0,0 +1,185 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import copy
+import copyreg
+import io
+import os
+import pickle
+from dataclasses import dataclass
+
+from utils.configmanager import ConfigManager
+
+CLAIMS_ATTR = "_claim_checks"
+DEFAULT_THRESHOLD = 256 * 1024
+DEFAULT_PREFIX = "claim-checks/"
+DEFAULT_LOCAL_PATH = "/tmp/claim-checks"
+
+
+@dataclass
+class ClaimCheck:
+    store: str
+    key: str
+    pickled: bool = False
+    size: int = 0
+
+    def resolve(self):
+        data = ClaimCheckConfig.get_store(self.store).get(self.key)
+        return pickle.loads(data) if self.pickled else data
+
+
+class LocalStore:
+    def __init__(self, config):
+        self.path = config.get("path", DEFAULT_LOCAL_PATH)
+
+    def put(self, key, data):
+        filename = os.path.join(self.path, key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return key
+
+    def get(self, key):
+        with open(os.path.join(self.path, key), "rb") as f:
+            return f.read()
+
+    def list(self, prefix):
+        for root, _, filenames in os.walk(os.path.join(self.path, prefix)):
+            for filename in filenames:
+                yield os.path.relpath(os.path.join(root, filename), self.path)
+
+
+class S3Store:
+    def __init__(self, config):
+        from services.storage import S3
+
+        self.s3 = S3(config.get("s3") or ConfigManager.get_config_value("aws", "s3"))
+
+    def put(self, key, data):
+        return self.s3.upload_bytes(data, key)
+
+    def get(self, key):
+        handle = io.BytesIO()
+        self.s3.download_obj(key, handle)
+        return handle.getvalue()
+
+    def list(self, prefix):
+        return self.s3.list_files_in_dir(prefix)
+
+
+STORES = {"local": LocalStore, "s3": S3Store}
+
+
+class ClaimCheckConfig:
+    __config = None
+    __stores = {}
+
+    @classmethod
+    def get_config(cls):
+        if cls.__config is None:
+            stream_config = ConfigManager.get_config_value("events-stream")
+            cls.__config = stream_config.get("claim_check") or {}
+        return cls.__config
+
+    @classmethod
+    def set_config(cls, config):
+        cls.__config = config
+        cls.__stores = {}
+
+    @classmethod
+    def get_store(cls, name):
+        if name not in cls.__stores:
+            cls.__stores[name] = STORES[name](cls.get_config())
+        return cls.__stores[name]
+
+
+def payload_size(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if hasattr(value, "getbands") and hasattr(value, "size"):  # PIL.Image
+        width, height = value.size
+        return width * height * len(value.getbands())
+    return 0
+
+
+def offload_payloads(event):
+    config = ClaimCheckConfig.get_config()
+    if not config:
+        return event
+    threshold = config.get("threshold", DEFAULT_THRESHOLD)
+    store_name = config.get("store", "local")
+    prefix = config.get("prefix", DEFAULT_PREFIX)
+
+    state = vars(event)
+    claims = {}
+    for name, value in state.items():
+        size = payload_size(value)
+        if size and size >= threshold:
+            pickled = not isinstance(value, (bytes, bytearray, memoryview))
+            data = pickle.dumps(value) if pickled else bytes(value)
+            key = ClaimCheckConfig.get_store(store_name).put(f"{prefix}{event.uuid}/{name}", data)
+            claims[name] = ClaimCheck(store_name, key, pickled, size)
+    if not claims:
+        return event
+
+    # The producer keeps its own event untouched, only the copy written to the stream is offloaded
+    offloaded = type(event).__new__(type(event))
+    offloaded.__dict__.update({k: v for k, v in state.items() if k not in claims})
+    offloaded.__dict__[CLAIMS_ATTR] = claims
+    return track_claims(offloaded)
+
+
+class ClaimedEvent:
+    # Mixed into the class of events that have offloaded payloads, until they are all resolved, so only
+    # those events pay for the attribute hook. Claims are resolved before the normal lookup, which would
+    # find class defaults like OCREvent.data = None.
+    __claimed_class__ = None
+
+    def __getattribute__(self, name):
+        claims = object.__getattribute__(self, "__dict__").get(CLAIMS_ATTR)
+        if claims and name in claims:
+            return resolve_claim(self, name)
+        return object.__getattribute__(self, name)
+
+    def __reduce_ex__(self, protocol):
+        # Pickled as the regular class, decode_event tracks the claims again
+        return copyreg._reconstructor, (type(self).__claimed_class__, object, None), self.__dict__
+
+    def __copy__(self):
+        event = object.__new__(type(self))
+        event.__dict__.update(self.__dict__)
+        return event
+
+    def __deepcopy__(self, memo):
+        event = object.__new__(type(self))
+        memo[id(self)] = event
+        event.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return event
+
+
+_claimed_classes = {}
+
+
+def claimed_class(cls):
+    if cls not in _claimed_classes:
+        attrs = {"__claimed_class__": cls, "__module__": cls.__module__, "__qualname__": cls.__qualname__}
+        _claimed_classes[cls] = type(cls.__name__, (ClaimedEvent, cls), attrs)
+    return _claimed_classes[cls]
+
+
+def track_claims(event):
+    if CLAIMS_ATTR in getattr(event, "__dict__", ()) and not isinstance(event, ClaimedEvent):
+        event.__class__ = claimed_class(type(event))
+    return event
+
+
+def resolve_claim(event, name):
+    claims = event.__dict__.get(CLAIMS_ATTR)
+    if not claims or name not in claims:
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(event).__name__, name))
+    value = claims[name].resolve()
+    setattr(event, name, value)
+    del claims[name]
+    if not claims:
+        del event.__dict__[CLAIMS_ATTR]
+        event.__class__ = type(event).__claimed_class__
+    return value
@@ -0,0 +1,238 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import pickle
+import zlib
+from importlib import import_module
+
+from events.claimcheck import track_claims
+from utils.configmanager import ConfigManager
+
+# Encoded events start with a 3 bytes header: format version, codec id and compression id.
+# Events without a header are plain pickles (protocol >= 2 always starts with 0x80), which keeps
+# streams written by older producers readable while a fleet is being rolled out.
+HEADER_VERSION = 1
+HEADER_SIZE = 3
+
+PICKLE = 1
+MSGPACK = 2
+
+NO_COMPRESSION = 0
+ZLIB = 1
+ZSTD = 2
+LZ4 = 3
+
+DEFAULT_COMPRESSION_THRESHOLD = 4096
+
+# msgpack extension types
+EXT_PICKLE = 1
+EXT_TUPLE = 2
+EXT_EVENT_TYPE = 3
+
+
+class Codec:
+    def __init__(self, codec_id, name, encode, decode):
+        self.codec_id = codec_id
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+
+
+class Compressor:
+    def __init__(self, compression_id, name, compress, decompress):
+        self.compression_id = compression_id
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+_codecs = {}
+_codecs_by_id = {}
+_compressors = {}
+_compressors_by_id = {}
+
+
+def register_codec(codec_id, name, encode, decode):
+    codec = Codec(codec_id, name, encode, decode)
+    _codecs[name] = codec
+    _codecs_by_id[codec_id] = codec
+    return codec
+
+
+def register_compressor(compression_id, name, compress, decompress):
+    compressor = Compressor(compression_id, name, compress, decompress)
+    _compressors[name] = compressor
+    _compressors_by_id[compression_id] = compressor
+    return compressor
+
+
+def get_codec(name_or_id):
+    registry = _codecs_by_id if isinstance(name_or_id, int) else _codecs
+    if name_or_id not in registry:
+        raise ValueError("Unknown event codec: {}".format(name_or_id))
+    return registry[name_or_id]
+
+
+def get_compressor(name_or_id):
+    registry = _compressors_by_id if isinstance(name_or_id, int) else _compressors
+    if name_or_id not in registry:
+        raise ValueError("Unknown event compression: {}".format(name_or_id))
+    return registry[name_or_id]
+
+
+class CodecConfig:
+    __settings = None
+
+    @classmethod
+    def get_settings(cls):
+        if cls.__settings is None:
+            stream_config = ConfigManager.get_config_value("events-stream")
+            cls.__settings = CodecSettings(stream_config.get("codec") or {})
+        return cls.__settings
+
+    @classmethod
+    def set_settings(cls, settings):
+        cls.__settings = settings
+
+
+class CodecSettings:
+    def __init__(self, config={}):
+        self.default = config.get("default", "pickle")
+        self.event_types = config.get("event_types") or {}
+        self.compression = config.get("compression")
+        self.compression_threshold = config.get("compression_threshold", DEFAULT_COMPRESSION_THRESHOLD)
+        # Write events.routing headers, only once every consumer reads them (see events.routing)
+        self.routing_header = config.get("routing_header", False)
+
+    def codec_for(self, event_type):
+        name = getattr(event_type, "name", event_type)
+        return self.event_types.get(name, self.default)
+
+
+def encode_event(event, codec=None, compression=None, compression_threshold=None):
+    settings = CodecConfig.get_settings() if codec is None or compression is None else None
+    codec = get_codec(codec or settings.codec_for(event.event_type))
+    compression = compression if compression is not None else settings.compression
+    if compression_threshold is None:
+        compression_threshold = settings.compression_threshold if settings else DEFAULT_COMPRESSION_THRESHOLD
+
+    payload = codec.encode(event)
+    compressor = None
+    if compression and len(payload) >= compression_threshold:
+        compressor = get_compressor(compression)
+        payload = compressor.compress(payload)
+
+    if codec.codec_id == PICKLE and compressor is None:
+        return payload  # Legacy format, readable by consumers that predate the header
+    compression_id = compressor.compression_id if compressor else NO_COMPRESSION
+    return bytes((HEADER_VERSION, codec.codec_id, compression_id)) + payload
+
+
+def decode_event(bytes_):
+    if bytes_[0] != HEADER_VERSION:
+        return track_claims(pickle.loads(bytes_))
+    _, codec_id, compression_id = bytes_[:HEADER_SIZE]
+    payload = memoryview(bytes_)[HEADER_SIZE:]
+    if compression_id != NO_COMPRESSION:
+        payload = get_compressor(compression_id).decompress(payload)
+    return track_claims(get_codec(codec_id).decode(payload))
+
+
+def event_class(name):
+    from events.events import BaseEvent
+
+    if name not in event_class.cache:
+        pending = [BaseEvent]
+        while pending:
+            cls = pending.pop()
+            if "__claimed_class__" not in vars(cls):  # events.claimcheck subclasses share the name
+                event_class.cache[cls.__name__] = cls
+            pending.extend(cls.__subclasses__())
+    return event_class.cache[name]
+
+
+event_class.cache = {}
+
+
+def _msgpack():
+    return import_module("msgpack")
+
+
+def _pack_default(obj):
+    from events.events import EventType
+
+    msgpack = _msgpack()
+    if isinstance(obj, EventType):
+        return msgpack.ExtType(EXT_EVENT_TYPE, obj.name.encode("utf-8"))
+    if type(obj) is tuple:
+        return msgpack.ExtType(EXT_TUPLE, _packb(list(obj)))
+    return msgpack.ExtType(EXT_PICKLE, pickle.dumps(obj))
+
+
+def _ext_hook(code, data):
+    from events.events import EventType
+
+    if code == EXT_EVENT_TYPE:
+        return EventType[bytes(data).decode("utf-8")]
+    if code == EXT_TUPLE:
+        return tuple(_unpackb(data))
+    if code == EXT_PICKLE:
+        return pickle.loads(data)
+    return _msgpack().ExtType(code, data)
+
+
+def _packb(obj):
+    return _msgpack().packb(obj, default=_pack_default, strict_types=True, use_bin_type=True)
+
+
+def _unpackb(data):
+    return _msgpack().unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+CORE_FIELDS = ("timestamp", "uuid", "event_type", "correlations")
+
+
+def msgpack_encode(event):
+    state = vars(event)
+    extras = {k: v for k, v in state.items() if k not in CORE_FIELDS}
+    event_type = event.event_type.name if event.event_type else None
+    row = [type(event).__name__, event.timestamp, event.uuid, event_type, event.correlations, extras]
+    return _packb(row)
+
+
+def msgpack_decode(payload):
+    from events.events import EventType
+
+    class_name, timestamp, uuid, event_type, correlations, extras = _unpackb(payload)
+    cls = event_class(class_name)
+    event = cls.__new__(cls)
+    state = event.__dict__
+    state["timestamp"] = timestamp
+    state["uuid"] = uuid
+    state["event_type"] = EventType[event_type] if event_type else None
+    state["correlations"] = correlations
+    state.update(extras)
+    return event
+
+
+def _zstd_compress(data):
+    return import_module("zstandard").ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data):
+    return import_module("zstandard").ZstdDecompressor().decompress(data)
+
+
+def _lz4_compress(data):
+    return import_module("lz4.frame").compress(data)
+
+
+def _lz4_decompress(data):
+    return import_module("lz4.frame").decompress(data)
+
+
+register_codec(PICKLE, "pickle", pickle.dumps, pickle.loads)
+register_codec(MSGPACK, "msgpack", msgpack_encode, msgpack_decode)
+
+register_compressor(ZLIB, "zlib", zlib.compress, zlib.decompress)
+register_compressor(ZSTD, "zstd", _zstd_compress, _zstd_decompress)
+register_compressor(LZ4, "lz4", _lz4_compress, _lz4_decompress)
@@ -7,7 +7,7 @@ from dataclasses import dataclass, field
 
 # pylint: enable=import-error
 
-from utils.common import uuid_factory
+from utils.common import time_ordered_id
 
 
 class EventType(Enum):
@@ -90,6 +90,15 @@ class EventType(Enum):
     DOCUMENT_IMAGE_CLASSIFIED = auto()
 
 
+make_event_id = time_ordered_id
+
+
+def set_event_id_factory(factory):
+    # e.g. utils.common.uuid_id for uuid4 based ids, called once at startup
+    global make_event_id
+    make_event_id = factory
+
+
 @dataclass
 class BaseEvent:
     timestamp: float = field(default=None)
@@ -100,7 +109,7 @@ class BaseEvent:
     def __post_init__(self):
         self.timestamp = self.timestamp or time.time()
         # pylint: disable=no-member
-        self.uuid = self.uuid or uuid_factory(self.prefix or "EVENT")()
+        self.uuid = self.uuid or make_event_id(self.prefix or "EVENT")
         self.event_type = self.event_type or EventType.GENERIC_EVENT
 
     def update_correlations(self, correlations):
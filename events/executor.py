@@ -0,0 +1,75 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+from concurrent import futures
+
+from utils.common import extract_attr
+
+DEFAULT_WORKERS = 4
+
+
+class HandlerExecutor:
+    # Without an ordering_key events run on one pool of `workers` in no particular order. With one, events
+    # that share its value (e.g. "correlations.stream_id") always go to the same single worker lane and are
+    # handled in the order they were read. "stream" orders whole streams, so a group reading one stream
+    # gets no concurrency at all.
+    def __init__(self, executor_config):
+        self.workers = executor_config.get("workers", DEFAULT_WORKERS)
+        self.max_in_flight = executor_config.get("max_in_flight", self.workers * 4)
+        self.ordering_key = executor_config.get("ordering_key")
+        process_pool = executor_config.get("type") == "process"
+        pool_class = futures.ProcessPoolExecutor if process_pool else futures.ThreadPoolExecutor
+        if self.ordering_key:
+            self.lanes = [pool_class(max_workers=1) for _ in range(self.workers)]
+        else:
+            self.lanes = [pool_class(max_workers=self.workers)]
+        self.in_flight = {}
+
+    def key_for(self, stream_name, event):
+        if not self.ordering_key:
+            return None
+        if self.ordering_key == "stream" or isinstance(event, list):  # Batch jobs are ordered per stream
+            return stream_name
+        return extract_attr(event, self.ordering_key) or stream_name
+
+    def submit(self, f, stream_name, job, args={}):
+        handler, event, event_id, ack_ids = job
+        lane = self.lanes[hash(self.key_for(stream_name, event)) % len(self.lanes)]
+        future = lane.submit(f, handler, stream_name, event, event_id, **args)
+        self.in_flight[future] = (stream_name, event, ack_ids)
+        return future
+
+    def in_flight_ids(self):
+        ids = {}
+        for stream_name, _, ack_ids in self.in_flight.values():
+            if isinstance(stream_name, bytes):
+                stream_name = stream_name.decode("utf-8")
+            ids.setdefault(stream_name, []).extend(ack_ids)
+        return ids
+
+    def running(self):
+        return [f for f in self.in_flight if not f.done()]
+
+    def capacity(self):
+        return self.max_in_flight - len(self.running())
+
+    def wait_for_capacity(self):
+        running = self.running()
+        if len(running) >= self.max_in_flight:
+            futures.wait(running, return_when=futures.FIRST_COMPLETED)
+
+    def collect(self, metrics):
+        # Jobs run timed_call_handler, so every finished future holds (digested, seconds)
+        acks = {}
+        for future in [f for f in self.in_flight if f.done()]:
+            stream_name, event, ack_ids = self.in_flight.pop(future)
+            if future.exception() is not None:
+                continue
+            digested, seconds = future.result()
+            metrics.observe_handler(stream_name, event, ack_ids, seconds)
+            if digested:
+                acks.setdefault(stream_name, []).extend(ack_ids)
+        return acks
+
+    def shutdown(self, wait=True):
+        for lane in self.lanes:
+            lane.shutdown(wait=wait)
@@ -0,0 +1,144 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+from utils.configmanager import ConfigManager
+
+INDEXABLE_TYPES = (str, int, float, bytes)
+DEFAULT_TRIM_EVERY = 1000  # Indexed events produced to a stream, per process, between trims of its index
+
+
+class StreamIndexConfig:
+    __indexes = None
+    __trim_every = None
+    __written = {}
+
+    @classmethod
+    def get_indexes(cls):
+        if cls.__indexes is None:
+            stream_config = ConfigManager.get_config_value("events-stream")
+            cls.__indexes = stream_config.get("indexes") or {}
+        return cls.__indexes
+
+    @classmethod
+    def set_indexes(cls, indexes):
+        cls.__indexes = indexes
+
+    @classmethod
+    def indexed_paths(cls, stream_name):
+        return cls.get_indexes().get(_str(stream_name)) or []
+
+    @classmethod
+    def get_trim_every(cls):
+        if cls.__trim_every is None:
+            stream_config = ConfigManager.get_config_value("events-stream")
+            cls.__trim_every = stream_config.get("index_trim_every", DEFAULT_TRIM_EVERY)
+        return cls.__trim_every
+
+    @classmethod
+    def set_trim_every(cls, trim_every):
+        cls.__trim_every = trim_every
+
+    @classmethod
+    def count_writes(cls, stream_name, n):
+        # True once every trim_every events, so producers trim the index of entries the stream dropped
+        stream_name = _str(stream_name)
+        written = cls.__written.get(stream_name, 0) + n
+        if written < cls.get_trim_every():
+            cls.__written[stream_name] = written
+            return False
+        cls.__written[stream_name] = 0
+        return True
+
+
+def _str(s):
+    return s.decode("utf-8") if isinstance(s, bytes) else s
+
+
+def index_key(stream_name, path):
+    return "{}:index:{}".format(_str(stream_name), path)
+
+
+def index_ts_key(stream_name, path):
+    return "{}:index-ts:{}".format(_str(stream_name), path)
+
+
+def extract_values(item, path):
+    # Like extract_attr, but lists are fanned out so "detections.id" yields the id of every detection
+    items = [item]
+    for name in path.split("."):
+        found = []
+        for item in items:
+            item = item.get(name) if type(item) is dict else getattr(item, name, None)
+            if isinstance(item, (list, tuple)):
+                found.extend(item)
+            elif item is not None:
+                found.append(item)
+        items = found
+    return [i for i in items if isinstance(i, INDEXABLE_TYPES)]
+
+
+def id_timestamp(event_id):
+    return int(_str(event_id).split("-")[0])
+
+
+def add_index_writes(pipe, stream_name, events, event_ids):
+    paths = StreamIndexConfig.indexed_paths(stream_name)
+    n = 0
+    for event, event_id in zip(events, event_ids):
+        score = id_timestamp(event_id)
+        for path in paths:
+            for value in extract_values(event, path):
+                pipe.hset(index_key(stream_name, path), str(value), event_id)
+                pipe.zadd(index_ts_key(stream_name, path), {str(value): score})
+                n += 1
+    return n
+
+
+def index_events(broker, stream_name, events, event_ids):
+    if not StreamIndexConfig.indexed_paths(stream_name):
+        return None
+    pipe = broker.pipeline(transaction=False)
+    add_index_writes(pipe, stream_name, events, event_ids)
+    result = pipe.execute()
+    if StreamIndexConfig.count_writes(stream_name, len(events)):
+        trim_index(broker, stream_name)
+    return result
+
+
+def lookup_event_id(broker, stream_name, path, value):
+    if path not in StreamIndexConfig.indexed_paths(stream_name):
+        return None
+    return broker.hget(index_key(stream_name, path), str(value))
+
+
+# Trimming drops index entries older than the first entry left in the stream, in three round trips. The
+# steps are shared with the asyncio producer, which only differs in awaiting them.
+def add_stale_reads(pipe, stream_name, first):
+    if not first:
+        return []
+    horizon = id_timestamp(first[0][0])
+    paths = StreamIndexConfig.indexed_paths(stream_name)
+    for path in paths:
+        pipe.zrangebyscore(index_ts_key(stream_name, path), "-inf", "({}".format(horizon))
+    return paths
+
+
+def add_trim_writes(pipe, stream_name, paths, stale_values):
+    removed = 0
+    for path, stale in zip(paths, stale_values):
+        if stale:
+            pipe.hdel(index_key(stream_name, path), *stale)
+            pipe.zrem(index_ts_key(stream_name, path), *stale)
+            removed += len(stale)
+    return removed
+
+
+def trim_index(broker, stream_name):
+    pipe = broker.pipeline(transaction=False)
+    paths = add_stale_reads(pipe, stream_name, broker.xrange(stream_name, count=1))
+    if not paths:
+        return 0
+    pipe, stale_values = broker.pipeline(transaction=False), pipe.execute()
+    removed = add_trim_writes(pipe, stream_name, paths, stale_values)
+    if removed:
+        pipe.execute()
+    return removed
@@ -0,0 +1,205 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.clients import prometheus_text as clients_prometheus_text
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+BUCKETS = {
+    "read_latency_seconds": LATENCY_BUCKETS,
+    "decode_seconds": LATENCY_BUCKETS,
+    "handler_seconds": LATENCY_BUCKETS,
+    "ack_latency_seconds": LATENCY_BUCKETS,
+    "end_to_end_lag_seconds": LAG_BUCKETS,
+    "batch_size": SIZE_BUCKETS,
+}
+
+DEFAULT_EXPORT_INTERVAL = 60
+DEFAULT_METRICS_STREAM = "consumer-metrics"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for le, n in zip(self.buckets + ("+Inf",), self.counts):
+            total += n
+            yield le, total
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "buckets": {str(le): n for le, n in self.cumulative()}}
+
+
+def _label(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return getattr(value, "name", value) or ""
+
+
+def id_timestamp(event_id):
+    return int(_label(event_id).split("-")[0]) / 1000
+
+
+def event_type_of(event):
+    return event[0].event_type if isinstance(event, list) else event.event_type
+
+
+class NullMetrics:
+    def observe(self, name, value, stream="", event_type=""):
+        pass
+
+    def observe_handler(self, stream_name, event, event_ids, seconds):
+        pass
+
+    def maybe_export(self):
+        pass
+
+
+class ConsumerMetrics:
+    def __init__(self, group_name, consumer_name, metrics_config):
+        self.group_name = group_name
+        self.consumer_name = consumer_name
+        self.stream = metrics_config.get("stream", DEFAULT_METRICS_STREAM)
+        self.interval = metrics_config.get("interval", DEFAULT_EXPORT_INTERVAL)
+        self.reset_on_export = metrics_config.get("reset_on_export", False)
+        self.histograms = {}
+        self.next_export = time.time() + self.interval
+        self.lock = threading.Lock()
+        if metrics_config.get("prometheus_port"):
+            MetricsServer.register(self, metrics_config["prometheus_port"])
+
+    @classmethod
+    def from_config(cls, group_name, consumer_name, metrics_config):
+        return cls(group_name, consumer_name, metrics_config) if metrics_config else NullMetrics()
+
+    def observe(self, name, value, stream="", event_type=""):
+        key = (name, _label(stream), _label(event_type))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(BUCKETS[name])
+            self.histograms[key].observe(value)
+
+    def observe_handler(self, stream_name, event, event_ids, seconds):
+        event_type = event_type_of(event)
+        self.observe("handler_seconds", seconds, stream_name, event_type)
+        now = time.time()
+        for event_id in event_ids:
+            self.observe("end_to_end_lag_seconds", now - id_timestamp(event_id), stream_name, event_type)
+
+    def snapshot(self):
+        with self.lock:
+            histograms = [
+                dict(name=name, stream=stream, event_type=event_type, **histogram.to_dict())
+                for (name, stream, event_type), histogram in self.histograms.items()
+            ]
+            if self.reset_on_export:
+                self.histograms = {}
+        return {"group": self.group_name, "consumer": self.consumer_name, "histograms": histograms}
+
+    def export(self):
+        from events.events import MetricsEvent
+        from events.redisstream import produce_one
+
+        event = MetricsEvent(self.snapshot(), correlations={"group": self.group_name})
+        return produce_one(self.stream, event)
+
+    def maybe_export(self):
+        if time.time() < self.next_export:
+            return None
+        self.next_export = time.time() + self.interval
+        try:
+            return self.export()
+        except Exception as e:
+            print(f"Can't export consumer metrics: {e}")
+            return None
+
+    def labeled_histograms(self):
+        labels = f'group="{self.group_name}",consumer="{self.consumer_name}"'
+        with self.lock:
+            return [
+                (name, f'{labels},stream="{stream}",event_type="{event_type}"', histogram)
+                for (name, stream, event_type), histogram in self.histograms.items()
+            ]
+
+    def prometheus_text(self):
+        return prometheus_text([self])
+
+
+def prometheus_text(metrics_list):
+    # Samples of a metric must be grouped under a single TYPE line, across every consumer of the process
+    samples = sorted(
+        (sample for metrics in metrics_list for sample in metrics.labeled_histograms()), key=lambda s: s[:2]
+    )
+    lines = []
+    for i, (name, labels, histogram) in enumerate(samples):
+        metric = "stream_consumer_" + name
+        if i == 0 or samples[i - 1][0] != name:
+            lines.append(f"# TYPE {metric} histogram")
+        for le, n in histogram.cumulative():
+            lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {n}')
+        lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    # One HTTP server per process and port, shared by every consumer of the process (e.g. several consumer
+    # tasks in one Celery worker). If another process has the port, it's logged and the consumer runs on,
+    # its metrics are still exported to the metrics stream.
+    __metrics = {}
+    __servers = {}
+    __pid = None
+    __lock = threading.Lock()
+
+    @classmethod
+    def register(cls, metrics, port):
+        with cls.__lock:
+            if cls.__pid != os.getpid():  # Server threads don't survive forks
+                cls.__metrics, cls.__servers, cls.__pid = {}, {}, os.getpid()
+            cls.__metrics.setdefault(port, []).append(metrics)
+            if port not in cls.__servers:
+                cls.__servers[port] = cls.start(port)
+            return cls.__servers[port]
+
+    @classmethod
+    def render(cls, port):
+        return prometheus_text(list(cls.__metrics.get(port, []))) + clients_prometheus_text()
+
+    @classmethod
+    def start(cls, port):
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = cls.render(port).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer(("", port), MetricsHandler)
+        except OSError as e:
+            print(f"Can't serve consumer metrics on port {port}: {e}")
+            return None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,87 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import time
+
+DEFAULT_MAXLEN = 10000  # produce_one's default trim horizon
+DEFAULT_RISK_RATIO = 0.8
+
+
+def _str(s):
+    return s.decode("utf-8") if isinstance(s, bytes) else s
+
+
+def parse_id(event_id):
+    ts, seq = _str(event_id).split("-")
+    return int(ts), int(seq)
+
+
+def _get(d, key):
+    # xinfo replies use "-" in keys, some redis-py versions convert them to "_"
+    return d.get(key, d.get(key.replace("-", "_")))
+
+
+class StreamMonitor:
+    def __init__(self, maxlen=DEFAULT_MAXLEN, risk_ratio=DEFAULT_RISK_RATIO):
+        self.maxlen = maxlen
+        self.risk_ratio = risk_ratio
+        self.samples = {}
+
+    def growth_rate(self, stream_name, added):
+        now = time.time()
+        previous = self.samples.get(stream_name)
+        self.samples[stream_name] = (now, added)
+        if not previous or now <= previous[0]:
+            return None
+        return (added - previous[1]) / (now - previous[0])
+
+    def stream_report(self, broker, stream_name, group_name):
+        info = broker.xinfo_stream(stream_name)
+        groups = [g for g in broker.xinfo_groups(stream_name) if _str(g["name"]) == group_name]
+        if not groups:
+            return None
+        group = groups[0]
+        consumers = broker.xinfo_consumers(stream_name, group_name)
+
+        length = info["length"]
+        entries_added = _get(info, "entries-added")  # Redis >= 7, length shrinks when the stream is trimmed
+        first_entry = _get(info, "first-entry")
+        last_id = parse_id(_get(info, "last-generated-id"))
+        delivered_id = parse_id(_get(group, "last-delivered-id"))
+        lag = group.get("lag")  # Redis >= 7
+
+        # Entries the group has not read yet that are already gone from the stream were silently dropped
+        trimmed = bool(first_entry) and delivered_id < parse_id(first_entry[0]) and delivered_id != (0, 0)
+        at_risk = trimmed or (lag is not None and lag >= self.maxlen * self.risk_ratio)
+
+        return {
+            "stream": _str(stream_name),
+            "group": group_name,
+            "length": length,
+            "pending": group["pending"],
+            "lag": lag,
+            "lag_ms": max(0, last_id[0] - delivered_id[0]),
+            "backlog": group["pending"] + (lag or 0),
+            "growth_rate": self.growth_rate(_str(stream_name), entries_added or length),
+            "consumers": [
+                {"name": _str(c["name"]), "pending": c["pending"], "idle_ms": c["idle"]} for c in consumers
+            ],
+            "trimmed": trimmed,
+            "at_trim_risk": at_risk,
+        }
+
+    def group_report(self, broker, consumer_group_config):
+        reports = []
+        for stream_name in consumer_group_config["streams"]:
+            if broker.exists(stream_name):
+                report = self.stream_report(broker, stream_name, consumer_group_config["name"])
+                if report:
+                    reports.append(report)
+        return reports
+
+
+def monitor_consumer_groups(consumer_group_configs, monitor=None):
+    from events.redisstream import RedisStream
+
+    broker = RedisStream.get_broker()
+    monitor = monitor or StreamMonitor()
+    return [report for config in consumer_group_configs for report in monitor.group_report(broker, config)]
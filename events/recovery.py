@@ -0,0 +1,79 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+DEFAULT_INTERVAL = 30  # seconds between sweeps
+DEFAULT_MIN_IDLE_TIME = 60000  # ms an entry must be pending before it is reclaimed
+DEFAULT_MAX_DELIVERIES = 5
+DEFAULT_SWEEP_COUNT = 100
+DEFAULT_DEAD_LETTER_MAXLEN = 10000
+
+
+def dead_letter_stream(stream_name, recovery_config):
+    if isinstance(stream_name, bytes):
+        stream_name = stream_name.decode("utf-8")
+    return recovery_config.get("dead_letter_stream") or stream_name + ":dead-letter"
+
+
+def dead_letter(broker, stream_name, group_name, pending, recovery_config):
+    event_ids = [p["message_id"] for p in pending]
+    pipe = broker.pipeline(transaction=False)
+    for event_id in event_ids:
+        pipe.xrange(stream_name, event_id, event_id, count=1)
+    entries = pipe.execute()
+
+    target = dead_letter_stream(stream_name, recovery_config)
+    maxlen = recovery_config.get("dead_letter_maxlen", DEFAULT_DEAD_LETTER_MAXLEN)
+    pipe = broker.pipeline(transaction=False)
+    for p, entry in zip(pending, entries):
+        if not entry:
+            continue  # Already trimmed from the source stream, only the ack is left to do
+        _, fields = entry[0]
+        fields = dict(fields)
+        fields["__source_stream__"] = stream_name
+        fields["__source_id__"] = p["message_id"]
+        fields["__group__"] = group_name
+        fields["__deliveries__"] = p["times_delivered"]
+        pipe.xadd(target, fields, maxlen=maxlen)
+    pipe.xack(stream_name, group_name, *event_ids)
+    pipe.execute()
+    print(f"Moved {len(event_ids)} events from {stream_name} to dead-letter stream {target}")
+    return event_ids
+
+
+def reclaim(broker, stream_name, group_name, consumer_name, min_idle_time, count):
+    rsp = broker.xautoclaim(
+        stream_name, group_name, consumer_name, min_idle_time, start_id="0-0", count=count
+    )
+    entries = rsp[1]
+    deleted = [event_id for event_id, fields in entries if not fields]  # Trimmed while pending (Redis < 7)
+    if deleted:
+        broker.xack(stream_name, group_name, *deleted)
+    return [(event_id, fields) for event_id, fields in entries if fields]
+
+
+def keep_alive(broker, stream_name, group_name, consumer_name, event_ids):
+    # XCLAIM with JUSTID resets the idle time without counting a delivery
+    broker.xclaim(stream_name, group_name, consumer_name, 0, event_ids, justid=True)
+
+
+def sweep_pending(broker, consumer_group_config, consumer_name, in_flight={}):
+    # in_flight: {stream: [ids]} this consumer is still handling, they are not reclaimed or dead-lettered
+    # however long their handlers run
+    recovery_config = consumer_group_config["recovery"]
+    group_name = consumer_group_config["name"]
+    min_idle_time = recovery_config.get("min_idle_time", DEFAULT_MIN_IDLE_TIME)
+    max_deliveries = recovery_config.get("max_deliveries", DEFAULT_MAX_DELIVERIES)
+    count = recovery_config.get("count", DEFAULT_SWEEP_COUNT)
+
+    items = []
+    for stream_name in consumer_group_config["streams"]:
+        if in_flight.get(stream_name):
+            keep_alive(broker, stream_name, group_name, consumer_name, in_flight[stream_name])
+        pending = broker.xpending_range(stream_name, group_name, "-", "+", count, idle=min_idle_time)
+        poison = [p for p in pending if p["times_delivered"] >= max_deliveries]
+        if poison:
+            dead_letter(broker, stream_name, group_name, poison, recovery_config)
+        entries = reclaim(broker, stream_name, group_name, consumer_name, min_idle_time, count)
+        if entries:
+            items.append((stream_name, entries))
+    return items
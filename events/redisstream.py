@@ -1,11 +1,19 @@
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
-import redis
-import pickle
 import io
 import time
-from billiard import Pool, cpu_count  # Celery's multiprocessing fork
-
+import threading
+import traceback
+
+from events.claimcheck import offload_payloads
+from events.codecs import CodecConfig, encode_event, decode_event
+from events.executor import HandlerExecutor
+from events.index import index_events, lookup_event_id
+from events.metrics import ConsumerMetrics, NullMetrics
+from events.recovery import sweep_pending, DEFAULT_INTERVAL as DEFAULT_SWEEP_INTERVAL
+from events.routing import HEADER_KEYS, event_fields, split_unhandled
+from events.scan import find_first_event, find_first_item, match_event, find_first_by
+from utils.clients import ClientRegistry
 from utils.common import uuid_factory, extract_attr
 from utils.configmanager import ConfigManager
 
@@ -17,29 +25,98 @@ class RedisStream:
     def get_broker(cls):
         if not cls.__broker:
             redis_config = ConfigManager.get_config_value("events-stream", "broker")
-            cls.__broker = redis.StrictRedis(
-                host=redis_config["host"],
-                port=redis_config["port"],
-                db=redis_config["db"],
-                password=redis_config["password"],
-            )
+            cls.__broker = ClientRegistry.redis("events-stream", redis_config)
         return cls.__broker
 
 
-def produce_one(name, event, maxlen=10000):
+def produce_one(name, event, maxlen=10000, approximate=True):
     r = RedisStream.get_broker()
-    key = event.uuid
-    value = event_to_bytes(event)
-    id_ = r.xadd(name, {key: value}, maxlen=maxlen)
+    id_ = r.xadd(name, event_to_fields(event), maxlen=maxlen, approximate=approximate)
+    index_events(r, name, [event], [id_])
     return id_
 
 
+def produce_many(name, events, maxlen=10000, approximate=True):
+    if not events:
+        return []
+    r = RedisStream.get_broker()
+    pipe = r.pipeline(transaction=False)
+    for event in events:
+        pipe.xadd(name, event_to_fields(event), maxlen=maxlen, approximate=approximate)
+    ids = pipe.execute()
+    index_events(r, name, events, ids)
+    return ids
+
+
+class BufferedProducer:
+    def __init__(self, name, maxlen=10000, approximate=True, max_batch=128, max_delay=0.05, on_flush=None):
+        self.name = name
+        self.maxlen = maxlen
+        self.approximate = approximate
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self._events = []
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def produce(self, event):
+        with self._lock:
+            self._events.append(event)
+            if len(self._events) >= self.max_batch:
+                return self.flush()
+            if self._timer is None and self.max_delay is not None:
+                self._timer = threading.Timer(self.max_delay, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        return None
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            events, self._events = self._events, []
+            if not events:
+                return []
+            try:
+                ids = produce_many(self.name, events, maxlen=self.maxlen, approximate=self.approximate)
+            except Exception:
+                # Kept for the next flush, ahead of anything produced meanwhile
+                self._events[:0] = events
+                raise
+            if self.on_flush:
+                self.on_flush(events, ids)
+            return ids
+
+    def _flush_from_timer(self):
+        # Nobody would see the exception otherwise, it dies with the timer thread
+        try:
+            self.flush()
+        except Exception:
+            print(f"Buffered producer for {self.name} failed to flush, {len(self._events)} events kept")
+            traceback.print_exc()
+
+    def close(self):
+        return self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def event_to_bytes(event):
-    return pickle.dumps(event)
+    return encode_event(offload_payloads(event))
+
+
+def event_to_fields(event):
+    return event_fields(event, event_to_bytes(event), CodecConfig.get_settings().routing_header)
 
 
 def bytes_to_event(bytes_):
-    return pickle.loads(bytes_)
+    return decode_event(bytes_)
 
 
 def consume_one(name):
@@ -47,8 +124,7 @@ def consume_one(name):
     e = r.xrange(name, count=1)
     if not e:
         return None
-    bytes_ = [v for v in e[0][1].values()][0]
-    return bytes_to_event(bytes_)
+    return bytes_to_event(event_from_dict(e[0][1]))
 
 
 def maybe_create_consumer_groups(broker, consumer_groups_config):
@@ -66,20 +142,102 @@ def maybe_create_consumer_groups(broker, consumer_groups_config):
 
 
 def decode_item(item):
-    stream_name, events = item
-    event_ids, event_dicts = zip(*[(event_id, event_dict) for event_id, event_dict in events])
-    events = tuple(
-        [bytes_to_event(event_bytes) for event_dict in event_dicts for event_bytes in event_dict.values()]
-    )
-    return stream_name, event_ids, events
+    stream_name, entries = item
+    event_ids, events = [], []
+    for event_id, event_dict in entries:
+        try:
+            event = bytes_to_event(event_from_dict(event_dict))
+        except Exception:
+            # Left unacked: the recovery sweep retries it and eventually moves it to the dead-letter stream
+            print(f"Can't decode event {event_id} from {stream_name}")
+            traceback.print_exc()
+            continue
+        event_ids.append(event_id)
+        events.append(event)
+    return stream_name, tuple(event_ids), tuple(events)
+
+
+def route_item(item, registered_handlers):
+    # Entries whose routing header names a type nobody handles are acked without decoding their payload
+    stream_name, entries = item
+    unhandled, entries = split_unhandled(entries, registered_handlers)
+    for event_type in dict.fromkeys(t for _, t in unhandled):
+        print("Ignoring event: {}".format(event_type))
+    stream_name, event_ids, events = decode_item((stream_name, entries))
+    return stream_name, [event_id for event_id, _ in unhandled], event_ids, events
+
+
+# Handlers are registered either as a callable or as {"handler": callable, "batch": True}.
+# Batch handlers receive every event of their type in a read as (stream_name, events, event_ids).
+def unpack_handler(entry):
+    if isinstance(entry, dict):
+        return entry["handler"], entry.get("batch", False)
+    return entry, False
+
+
+def call_handler(handler, *args, **kwargs):
+    try:
+        handler(*args, **kwargs)
+        return True
+    except Exception:
+        print(f"Handler {getattr(handler, '__name__', handler)} failed")
+        traceback.print_exc()
+        return False
+
+
+def timed_call_handler(handler, *args, **kwargs):
+    start = time.perf_counter()
+    digested = call_handler(handler, *args, **kwargs)
+    return digested, time.perf_counter() - start
 
 
 def digest_event(stream_name, event, event_id, registered_handlers, args={}):
     if event.event_type in registered_handlers:
-        handler = registered_handlers[event.event_type]
-        handler(stream_name, event, event_id, **args)
-    else:
-        print("Ignoring event: {}".format(event.event_type))
+        handler, _ = unpack_handler(registered_handlers[event.event_type])
+        return call_handler(handler, stream_name, event, event_id, **args)
+    print("Ignoring event: {}".format(event.event_type))
+    return True
+
+
+def plan_batch(events, event_ids, registered_handlers):
+    ignored = []
+    jobs = []  # (handler, event or events, event_id or event_ids, ids to ack when the handler succeeds)
+    batches = {}
+    for event_id, event in zip(event_ids, events):
+        entry = registered_handlers.get(event.event_type)
+        if entry is None:
+            print("Ignoring event: {}".format(event.event_type))
+            ignored.append(event_id)
+            continue
+        handler, batch = unpack_handler(entry)
+        if batch:
+            batch_ids, batch_events = batches.setdefault(event.event_type, ([], []))
+            batch_ids.append(event_id)
+            batch_events.append(event)
+        else:
+            jobs.append((handler, event, event_id, [event_id]))
+    for event_type, (batch_ids, batch_events) in batches.items():
+        handler, _ = unpack_handler(registered_handlers[event_type])
+        jobs.append((handler, batch_events, batch_ids, batch_ids))
+    return ignored, jobs
+
+
+def digest_batch(stream_name, events, event_ids, registered_handlers, args={}, metrics=NullMetrics()):
+    digested, jobs = plan_batch(events, event_ids, registered_handlers)
+    for handler, event, event_id, ack_ids in jobs:
+        ok, seconds = timed_call_handler(handler, stream_name, event, event_id, **args)
+        metrics.observe_handler(stream_name, event, ack_ids, seconds)
+        if ok:
+            digested.extend(ack_ids)
+    return digested
+
+
+def ack_batch(broker, group_name, acks):
+    pipe = broker.pipeline(transaction=False)
+    for stream_name, event_ids in acks.items():
+        if event_ids:
+            pipe.xack(stream_name, group_name, *event_ids)
+    return pipe.execute()
 
 
 def start_redis_consumer(consumer_group_config, registered_handlers, start_from=">"):
@@ -90,27 +248,93 @@ def start_redis_consumer(consumer_group_config, registered_handlers, start_from=
     group_name = consumer_group_config["name"]
     consumer_name = uuid_factory(group_name + "-consumer")()
     batch_size = consumer_group_config["batch_size"]
+    recovery_config = consumer_group_config.get("recovery")
+    next_sweep = time.time()
+    executor_config = consumer_group_config.get("executor")
+    executor = HandlerExecutor(executor_config) if executor_config else None
+    metrics = ConsumerMetrics.from_config(group_name, consumer_name, consumer_group_config.get("metrics"))
 
     while True:
-        item = broker.xreadgroup(group_name, consumer_name, streams_dict, count=batch_size, block=1000)
-        if item:
-            stream_name, event_ids, events = decode_item(item[0])  # TODO: Handle batchsize > 1
-            for event_id, event in zip(event_ids, events):
-                digest_event(stream_name, event, event_id, registered_handlers)
-                broker.xack(stream_name, group_name, event_id)
-
-
-def retrieve_event(stream_name, event_id):  # TODO: Handle case for retrieving batch of events
+        count, block = batch_size, 1000
+        if executor:
+            executor.wait_for_capacity()
+            count = min(batch_size, executor.capacity())
+            block = 100 if executor.running() else 1000  # Come back soon to ack finished handlers
+        items = []
+        if recovery_config and time.time() >= next_sweep:
+            # Before the read, entries read now are only acked at the end of the iteration
+            in_flight = executor.in_flight_ids() if executor else {}
+            items = sweep_pending(broker, consumer_group_config, consumer_name, in_flight)
+            next_sweep = time.time() + recovery_config.get("interval", DEFAULT_SWEEP_INTERVAL)
+        start = time.perf_counter()
+        read = broker.xreadgroup(group_name, consumer_name, streams_dict, count=count, block=block) or []
+        if read:
+            metrics.observe("read_latency_seconds", time.perf_counter() - start)
+        items += read
+        acks = {}
+        for item in items:
+            start = time.perf_counter()
+            stream_name, unhandled, event_ids, events = route_item(item, registered_handlers)
+            metrics.observe("decode_seconds", time.perf_counter() - start, stream_name)
+            metrics.observe("batch_size", len(event_ids), stream_name)
+            acks.setdefault(stream_name, []).extend(unhandled)
+            if executor:
+                ignored, jobs = plan_batch(events, event_ids, registered_handlers)
+                acks.setdefault(stream_name, []).extend(ignored)
+                [executor.submit(timed_call_handler, stream_name, job) for job in jobs]
+            else:
+                digested = digest_batch(stream_name, events, event_ids, registered_handlers, metrics=metrics)
+                acks.setdefault(stream_name, []).extend(digested)
+        if executor:
+            [acks.setdefault(s, []).extend(ids) for s, ids in executor.collect(metrics).items()]
+        if acks:
+            start = time.perf_counter()
+            ack_batch(broker, group_name, acks)
+            metrics.observe("ack_latency_seconds", time.perf_counter() - start)
+        metrics.maybe_export()
+
+
+def retrieve_event(stream_name, event_id):
     broker = RedisStream.get_broker()
     events = broker.xrange(stream_name, event_id, event_id, count=1)
     if not len(events):
         return None
     _, event_dict = events[0]
-    event_bytes = next(iter(event_dict.values()))
-    return bytes_to_event(event_bytes)
+    return bytes_to_event(event_from_dict(event_dict))
 
 
-def source_event(stream_name, filters_dict={}, batch_size=128, latest_first=True):
+def retrieve_events(stream_name, event_ids):
+    if not event_ids:
+        return []
+    broker = RedisStream.get_broker()
+    unique_ids = list(dict.fromkeys(event_ids))
+    pipe = broker.pipeline(transaction=False)
+    for event_id in unique_ids:
+        pipe.xrange(stream_name, event_id, event_id, count=1)
+    found = {}
+    for event_id, events in zip(unique_ids, pipe.execute()):
+        if events:
+            _, event_dict = events[0]
+            found[event_id] = bytes_to_event(event_from_dict(event_dict))
+    return [found.get(event_id) for event_id in event_ids]
+
+
+def source_indexed_event(stream_name, filters_dict):
+    broker = RedisStream.get_broker()
+    for attr_name, value in filters_dict.items():
+        event_id = lookup_event_id(broker, stream_name, attr_name, value)
+        if event_id:
+            event = retrieve_event(stream_name, event_id)
+            if event and match_event(event, filters_dict):
+                return event
+    return None
+
+
+def source_event(stream_name, filters_dict={}, batch_size=128, latest_first=True, scan_mode="auto"):
+    if latest_first:
+        event = source_indexed_event(stream_name, filters_dict)
+        if event:
+            return event
     broker = RedisStream.get_broker()
     next_id = "+" if latest_first else "-"
     i = 0
@@ -125,14 +349,10 @@ def source_event(stream_name, filters_dict={}, batch_size=128, latest_first=True
         if not n:
             return None
         event_ids, event_dicts = zip(*event_tuples)
-        with Pool(parallel_jobs(n)) as pool:
-            event_bytes = pool.map(event_from_dict, event_dicts)
-            events = pool.map(bytes_to_event, event_bytes)
-            args = zip(*(events, [filters_dict] * len(events)))
-            matches = pool.starmap(match_event, args)
-            if any(matches):
-                index = matches.index(True)
-                return events[index]
+        raw_events = [event_from_dict(d) for d in event_dicts]
+        index = find_first_event(raw_events, filters_dict, scan_mode)
+        if index is not None:
+            return bytes_to_event(raw_events[index])
         next_id = decrement_id(event_ids[-1]) if latest_first else increment_id(event_ids[-1])
     return None
 
@@ -156,17 +376,23 @@ def decrement_id(id_str):
     return bytes(new_id, "utf-8")
 
 
-def match_event(event, filters_dict):
-    for attr_name, value in filters_dict.items():
-        attr = extract_attr(event, attr_name)
-        if not attr or attr != value:
-            return False
-    return True
+def source_indexed_item_from_list_in_event(stream_name, list_name, field, value):
+    broker = RedisStream.get_broker()
+    event_id = lookup_event_id(broker, stream_name, "{}.{}".format(list_name, field), value)
+    if event_id:
+        event = retrieve_event(stream_name, event_id)
+        item = find_first_by(extract_attr(event, list_name) or [], field, value) if event else None
+        if item:
+            return item, event_id, event.correlations
+    return None, None, None
 
 
 def source_item_from_list_in_event(
-    stream_name, list_name, field, value, batch_size=1000,
+    stream_name, list_name, field, value, batch_size=1000, scan_mode="auto",
 ):
+    indexed = source_indexed_item_from_list_in_event(stream_name, list_name, field, value)
+    if indexed[0]:
+        return indexed
     broker = RedisStream.get_broker()
     next_id = "+"
     i = 0
@@ -178,32 +404,14 @@ def source_item_from_list_in_event(
         if not n:
             return None, None, None
         event_ids, event_dicts = zip(*event_tuples)
-
-        with Pool(parallel_jobs(n)) as pool:
-            event_bytes = pool.map(event_from_dict, event_dicts)
-            events = pool.map(bytes_to_event, event_bytes)
-            args = zip(*(events, [list_name] * len(events)))
-            dicts = pool.starmap(extract_attr, args)
-
-            args = zip(*(dicts, [field] * len(dicts), [value] * len(dicts)))
-            matches = pool.starmap(find_first_by, args)
-
-            for i, detection in enumerate(matches):
-                if detection:
-                    return detection, event_ids[i], events[i].correlations
+        raw_events = [event_from_dict(d) for d in event_dicts]
+        index, item = find_first_item(raw_events, list_name, field, value, scan_mode)
+        if index is not None:
+            return item, event_ids[index], bytes_to_event(raw_events[index]).correlations
         next_id = decrement_id(event_ids[-1])
     return None, None, None
 
 
-def find_first_by(dicts, field, value):
-    for d in dicts:
-        if d[field] == value:
-            return d
-    return None
-
-
 def event_from_dict(x):
-    return next(iter(x.values()))
-
+    return next(v for k, v in x.items() if k not in HEADER_KEYS)
 
-parallel_jobs = lambda x: min(x, cpu_count())
@@ -0,0 +1,152 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import re
+import time
+from datetime import datetime
+
+from events.redisstream import RedisStream, BufferedProducer, digest_batch, event_from_dict
+from events.routing import read_header
+from events.scan import decode_matching_events
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 128
+STREAM_ID = re.compile(r"^\(?\d+(-\d+)?$")
+
+
+def _str(s):
+    return s.decode("utf-8") if isinstance(s, bytes) else s
+
+
+def to_stream_id(value, default):
+    # Stream ids pass through, datetimes and epoch seconds become the first id of that millisecond
+    if value is None:
+        return default
+    if isinstance(value, datetime):
+        return str(int(value.timestamp() * 1000))
+    if isinstance(value, (int, float)):
+        return str(int(value * 1000))
+    value = _str(value)
+    if value in ("-", "+") or STREAM_ID.match(value):
+        return value
+    return str(int(datetime.fromisoformat(value).timestamp() * 1000))
+
+
+def iter_pages(broker, stream_name, start="-", end="+", page_size=DEFAULT_PAGE_SIZE):
+    next_start = start
+    while True:
+        entries = broker.xrange(stream_name, min=next_start, max=end, count=page_size)
+        if entries:
+            yield entries
+        if len(entries) < page_size:
+            return
+        next_start = "(" + _str(entries[-1][0])  # Exclusive range, Redis >= 6.2
+
+
+def _type_name(event_type):
+    return getattr(event_type, "name", event_type)
+
+
+def filter_page(entries, filters_dict={}, event_types=None, scan_mode="auto"):
+    if event_types:
+        # Entries with a routing header are filtered by type without decoding them
+        headers = [read_header(event_dict) for _, event_dict in entries]
+        entries = [e for e, h in zip(entries, headers) if h is None or h["event_type"] in event_types]
+    if not entries:
+        return [], []
+    event_ids, event_dicts = zip(*entries)
+    raw_events = [event_from_dict(d) for d in event_dicts]
+    matches = decode_matching_events(raw_events, filters_dict, scan_mode)
+    events = [event for _, event in matches]
+    event_ids = [event_ids[i] for i, _ in matches]
+    if event_types:
+        pairs = [(i, e) for i, e in zip(event_ids, events) if _type_name(e.event_type) in event_types]
+        event_ids, events = [i for i, _ in pairs], [e for _, e in pairs]
+    return event_ids, events
+
+
+def replay_events(
+    stream_name,
+    start=None,
+    end=None,
+    filters_dict={},
+    event_types=None,
+    predicate=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    scan_mode="auto",
+):
+    # Yields (event_id, event) one page at a time, the range is never loaded as a whole
+    broker = RedisStream.get_broker()
+    start, end = to_stream_id(start, "-"), to_stream_id(end, "+")
+    event_types = {_type_name(t) for t in event_types} if event_types else None
+    for entries in iter_pages(broker, stream_name, start, end, page_size):
+        event_ids, events = filter_page(entries, filters_dict, event_types, scan_mode)
+        for event_id, event in zip(event_ids, events):
+            if predicate is None or predicate(event):
+                yield event_id, event
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.rate = rate  # Events per second, None for no limit
+        self.next_time = time.monotonic()
+
+    def acquire(self, n=1):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time = max(self.next_time, now) + n / self.rate
+
+
+def batches(iterable, size):
+    batch = []
+    for x in iterable:
+        batch.append(x)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def replay(
+    stream_name,
+    start=None,
+    end=None,
+    target=None,
+    registered_handlers=None,
+    filters_dict={},
+    event_types=None,
+    predicate=None,
+    rate=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    batch_size=DEFAULT_BATCH_SIZE,
+    maxlen=10000,
+    scan_mode="auto",
+):
+    # Re-produces the selected events to the target stream and/or runs them through the handlers,
+    # registered the same way as for start_redis_consumer. Returns how many events were replayed.
+    limiter = RateLimiter(rate)
+    producer = None
+    if target:
+        producer = BufferedProducer(target, maxlen=maxlen, max_batch=batch_size, max_delay=None)
+    selected = replay_events(
+        stream_name, start, end, filters_dict, event_types, predicate, page_size, scan_mode
+    )
+    count = 0
+    try:
+        for batch in batches(selected, batch_size):
+            limiter.acquire(len(batch))
+            event_ids, events = [i for i, _ in batch], [e for _, e in batch]
+            if producer:
+                [producer.produce(event) for event in events]
+            if registered_handlers:
+                digested = digest_batch(stream_name, events, event_ids, registered_handlers)
+                if len(digested) < len(event_ids):
+                    print(f"{len(event_ids) - len(digested)} events failed to replay from {stream_name}")
+            count += len(batch)
+    finally:
+        if producer:
+            producer.close()
+    return count
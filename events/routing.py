@@ -0,0 +1,51 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import json
+
+# Optional routing header stored as an extra field of the stream entry. It lets consumers skip events they
+# don't handle without decoding them. Readers that predate it unpickle every field of an entry and fail on
+# the JSON header, so every consumer of a stream must run this version before routing_header is enabled.
+HEADER_FIELD = "__header__"
+HEADER_KEYS = (HEADER_FIELD, HEADER_FIELD.encode("utf-8"))
+
+
+def make_header(event):
+    header = {
+        "event_type": getattr(event.event_type, "name", event.event_type),
+        "uuid": event.uuid,
+        "correlations": event.correlations,
+    }
+    return json.dumps(header, default=str)
+
+
+def event_fields(event, payload, header=False):
+    fields = {event.uuid: payload}
+    if header:
+        fields[HEADER_FIELD] = make_header(event)
+    return fields
+
+
+def read_header(event_dict):
+    for key in HEADER_KEYS:
+        if key in event_dict:
+            try:
+                return json.loads(event_dict[key])
+            except ValueError:
+                return None
+    return None
+
+
+def handled_types(registered_handlers):
+    return {getattr(event_type, "name", event_type) for event_type in registered_handlers}
+
+
+def split_unhandled(entries, registered_handlers):
+    handled = handled_types(registered_handlers)
+    unhandled, entries_left = [], []
+    for event_id, event_dict in entries:
+        header = read_header(event_dict) if event_dict else None
+        if header is not None and header["event_type"] not in handled:
+            unhandled.append((event_id, header["event_type"]))
+        else:
+            entries_left.append((event_id, event_dict))
+    return unhandled, entries_left
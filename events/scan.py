@@ -0,0 +1,106 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import atexit
+import os
+from billiard import Pool, cpu_count  # Celery's multiprocessing fork
+
+from events.codecs import decode_event
+from utils.common import extract_attr
+
+# Workers only pay off for many small, object heavy events: large binary payloads are cheap to
+# unpickle but expensive to copy to another process, and short batches end early when scanned serially.
+MIN_PARALLEL_EVENTS = 512
+MAX_PARALLEL_EVENT_BYTES = 16 * 1024
+
+
+class ScanEngine:
+    __pool = None
+    __pid = None
+
+    @classmethod
+    def get_pool(cls):
+        if cls.__pool is None or cls.__pid != os.getpid():  # Pools are not inherited by forked workers
+            cls.__pool = Pool(cpu_count())
+            cls.__pid = os.getpid()
+        return cls.__pool
+
+    @classmethod
+    def close(cls):
+        if cls.__pool is not None and cls.__pid == os.getpid():
+            cls.__pool.terminate()
+        cls.__pool = None
+
+    @classmethod
+    def use_pool(cls, raw_events, mode="auto"):
+        if mode in ("serial", "parallel"):
+            return mode == "parallel"
+        if cpu_count() < 2 or len(raw_events) < MIN_PARALLEL_EVENTS:
+            return False
+        return sum(len(e) for e in raw_events) <= MAX_PARALLEL_EVENT_BYTES * len(raw_events)
+
+    @classmethod
+    def map(cls, f, args, mode="auto", raw_events=()):
+        if not cls.use_pool(raw_events, mode):
+            return map(f, args)
+        pool = cls.get_pool()
+        chunksize = max(1, len(raw_events) // (cpu_count() * 4))
+        return iter(pool.map(f, args, chunksize))
+
+
+atexit.register(ScanEngine.close)
+
+
+def match_event(event, filters_dict):
+    for attr_name, value in filters_dict.items():
+        attr = extract_attr(event, attr_name)
+        if not attr or attr != value:
+            return False
+    return True
+
+
+def find_first_by(dicts, field, value):
+    for d in dicts:
+        if d[field] == value:
+            return d
+    return None
+
+
+def _match_raw(args):
+    event_bytes, filters_dict = args
+    return match_event(decode_event(event_bytes), filters_dict)
+
+
+def _decode_matching(args):
+    event_bytes, filters_dict = args
+    event = decode_event(event_bytes)
+    return event if match_event(event, filters_dict) else None
+
+
+def _find_in_raw(args):
+    event_bytes, list_name, field, value = args
+    items = extract_attr(decode_event(event_bytes), list_name)
+    return find_first_by(items, field, value) if items else None
+
+
+def find_first_event(raw_events, filters_dict, mode="auto"):
+    # Filtering happens where the bytes are decoded, only the position of the first match comes back
+    args = ((event_bytes, filters_dict) for event_bytes in raw_events)
+    for i, matches in enumerate(ScanEngine.map(_match_raw, args, mode, raw_events)):
+        if matches:
+            return i
+    return None
+
+
+def find_first_item(raw_events, list_name, field, value, mode="auto"):
+    args = ((event_bytes, list_name, field, value) for event_bytes in raw_events)
+    for i, item in enumerate(ScanEngine.map(_find_in_raw, args, mode, raw_events)):
+        if item:
+            return i, item
+    return None, None
+
+
+def decode_matching_events(raw_events, filters_dict, mode="auto"):
+    # Events are decoded once, where they are matched, and only the matching ones come back
+    args = ((event_bytes, filters_dict) for event_bytes in raw_events)
+    decoded = ScanEngine.map(_decode_matching, args, mode, raw_events)
+    return [(i, event) for i, event in enumerate(decoded) if event is not None]
@@ -1,10 +1,7 @@
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
 from importlib import import_module
-from sqlalchemy.ext.declarative import declarative_base
 
-from utils.celery import CeleryManager
-from utils.common import make_url
 from utils.configmanager import ConfigManager
 
 config = ConfigManager.get_config_value("database")
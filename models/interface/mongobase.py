@@ -6,7 +6,8 @@ import datetime
 from marshmallow import Schema, fields, post_load, ValidationError
 
 from database.mongo import db
-from utils.common import uuid_factory
+from models.interface.mongodao import MongoDAO, insert_op
+from utils.common import chunks, uuid_factory
 
 
 class BytesField(fields.Field):
@@ -16,6 +17,7 @@ class BytesField(fields.Field):
 
 
 CONSTRAINT_ERROR_MSG = "constraint_value can't be None when IBase.__force_constraint__ is True"
+MAX_IDS_PER_QUERY = 1000  # Keeps $in filters well below the 16MB command limit
 
 
 @dataclass
@@ -42,10 +44,17 @@ class IMongoBase:
 
     @classmethod
     def get_many_by_ids(cls, ids, constraint_value={}):
-        ids = set(ids)
-        filters = [{"_id": id_} for id_ in ids]
-        rsp = (cls.get_first(f, constraint_value) for f in filters)
-        return (item for item in rsp if item)
+        if cls.__force_constraint__ and not constraint_value:
+            raise ValueError(CONSTRAINT_ERROR_MSG)
+        c = db[cls.__collection__]
+        ser = cls.__serializer__
+        ids = list(dict.fromkeys(ids))  # Unique ids, in input order
+        found = {}
+        for chunk in chunks(ids, MAX_IDS_PER_QUERY):
+            constrained_filter = {"_id": {"$in": chunk}}
+            constrained_filter.update(constraint_value)
+            found.update((d["_id"], d) for d in c.find(constrained_filter))
+        return (ser.load(found[id_]) for id_ in ids if id_ in found)
 
     @classmethod
     def get_many_by(cls, filters, constraint_value={}):
@@ -75,14 +84,32 @@ class IMongoBase:
         if cls.__force_constraint__ and not constraint_value:
             raise ValueError(CONSTRAINT_ERROR_MSG)
         c = db[cls.__collection__]
-        filters = [{"_id": id_} for id_ in ids]
-        [f.update(constraint_value) for f in filters]
-        [c.delete_one(f) for f in filters]
+        deleted = 0
+        for chunk in chunks(ids, MAX_IDS_PER_QUERY):
+            constrained_filter = {"_id": {"$in": chunk}}
+            constrained_filter.update(constraint_value)
+            deleted += c.delete_many(constrained_filter).deleted_count
+        return deleted
 
     def save(self, constraint_value={}):
         if self.__force_constraint__ and not constraint_value:
             raise ValueError(CONSTRAINT_ERROR_MSG)
         c = db[self.__collection__]
+        c.insert_one(self._serialize_new(constraint_value))
+
+    @classmethod
+    def save_many(cls, items, constraint_value={}):
+        # Every item is checked before anything is written. Inserts are unordered and chunked, the result
+        # has the per-item errors (e.g. duplicate keys) with the index of the item.
+        if cls.__force_constraint__ and not constraint_value:
+            raise ValueError(CONSTRAINT_ERROR_MSG)
+        docs = [item._serialize_new(constraint_value) for item in items]
+        for doc in docs:
+            if "_id" in doc and not doc["_id"]:
+                doc.pop("_id")
+        return MongoDAO(db[cls.__collection__]).bulk_write([insert_op(doc) for doc in docs])
+
+    def _serialize_new(self, constraint_value):
         serializer = self.__serializer__
         if not self.created_at:
             self.created_at = datetime.datetime.now()
@@ -97,8 +124,7 @@ class IMongoBase:
                         list(constraint_value.keys())
                     )
                 )
-
-        c.insert_one(serialized)
+        return serialized
 
     def update(self, data, constraint_value={}):
         if self.__force_constraint__ and not constraint_value:
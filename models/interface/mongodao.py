@@ -1,3 +1,40 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import bson
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MAX_BULK_OPS = 1000
+MAX_BULK_BYTES = 8 * 1024 * 1024  # Well under the 48MB message limit, bounds memory per batch
+
+
+# Operations for MongoDAO.bulk_write, paired with their BSON size so batches can be split by size
+def insert_op(item):
+    return InsertOne(item), len(bson.encode(item))
+
+
+def upsert_op(item, filters=None):
+    filters = filters or {"_id": item["_id"]}
+    return ReplaceOne(filters, item, upsert=True), len(bson.encode(filters)) + len(bson.encode(item))
+
+
+def update_op(filters, data, upsert=False):
+    size = len(bson.encode(filters)) + len(bson.encode(data))
+    return UpdateOne(filters, {"$set": data}, upsert=upsert), size
+
+
+def split_ops(ops, max_ops=MAX_BULK_OPS, max_bytes=MAX_BULK_BYTES):
+    batch, batch_bytes = [], 0
+    for op, size in ops:
+        if batch and (len(batch) >= max_ops or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(op)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
 class MongoDAO:
     def __init__(self, collection):
         self._collection = collection
@@ -58,7 +95,7 @@ class MongoDAO:
         try:
             r = self._collection.insert_one(item)
             return r.inserted_id
-        except:  # DuplicateKeyError
+        except DuplicateKeyError:
             return None
 
     def sample(self, filters={}, n=1):
@@ -66,11 +103,35 @@ class MongoDAO:
         return self._collection.aggregate(pipeline)
 
     def save_many(self, items):
+        # Unordered: a duplicate doesn't stop the rest of the items, only the inserted ids are returned
         for item in items:
             if "_id" in item and not item["_id"]:
                 item.pop("_id")
-        r = self._collection.insert_many(items)
-        return r.inserted_ids
+        result = self.bulk_write([insert_op(item) for item in items])
+        failed = {error["index"] for error in result["errors"]}
+        return [item["_id"] for i, item in enumerate(items) if i not in failed]
+
+    def bulk_write(self, ops, max_ops=MAX_BULK_OPS, max_bytes=MAX_BULK_BYTES):
+        # ops are built with insert_op, upsert_op and update_op. Batches run unordered, so a failed
+        # operation doesn't stop the others, and errors are reported with the index of their operation.
+        result = {"inserted": 0, "matched": 0, "modified": 0, "upserted_ids": {}, "errors": []}
+        offset = 0
+        for batch in split_ops(ops, max_ops, max_bytes):
+            try:
+                details = self._collection.bulk_write(batch, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                details = e.details
+            result["inserted"] += details["nInserted"]
+            result["matched"] += details["nMatched"]
+            result["modified"] += details["nModified"]
+            for upserted in details["upserted"]:
+                result["upserted_ids"][offset + upserted["index"]] = upserted["_id"]
+            for error in details["writeErrors"]:
+                result["errors"].append(
+                    {"index": offset + error["index"], "code": error["code"], "message": error["errmsg"]}
+                )
+            offset += len(batch)
+        return result
 
     def update_one(self, _id, data):
         r = self._collection.update_one({"_id": _id}, {"$set": data}, upsert=False)
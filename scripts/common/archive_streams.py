@@ -0,0 +1,27 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+
+from events.archive import ArchiveConfig, start_archiver
+
+DEFAULT_GROUP_NAME = "stream-archiver"
+DEFAULT_BATCH_SIZE = 500
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive events from the given streams to Parquet files")
+    parser.add_argument("streams", nargs="*", help="Default: events-stream.archive.streams")
+    parser.add_argument("--group", default=DEFAULT_GROUP_NAME, help="Consumer group of the archiver")
+    parser.add_argument("--consumer", help="Consumer name, distinct per archiver. Default: <group>-archiver")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Entries per XREADGROUP")
+    args = parser.parse_args()
+
+    consumer_group_config = {
+        "name": args.group,
+        "streams": args.streams or ArchiveConfig.get_config()["streams"],
+        "batch_size": args.batch_size,
+    }
+    recovery_config = ArchiveConfig.get_config().get("recovery")
+    if recovery_config:
+        consumer_group_config["recovery"] = recovery_config
+    start_archiver(consumer_group_config, consumer_name=args.consumer)
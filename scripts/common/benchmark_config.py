@@ -0,0 +1,50 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+import subprocess
+import sys
+import time
+
+from utils.configmanager import ConfigManager
+
+IMPORT_SCRIPT = """
+import time
+from utils.configmanager import ConfigManager
+ConfigManager.configure(cache={cache})
+start = time.perf_counter()
+{imports}
+print(time.perf_counter() - start)
+"""
+
+
+def time_calls(n, cache):
+    ConfigManager.configure(cache=cache)
+    start = time.perf_counter()
+    for _ in range(n):
+        ConfigManager.get_config_value("events-stream", "broker")
+    return (time.perf_counter() - start) / n
+
+
+def time_imports(modules, cache, repeat):
+    # Every run is a fresh interpreter, so module level config reads are paid again
+    script = IMPORT_SCRIPT.format(cache=cache, imports="\n".join(f"import {m}" for m in modules))
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare cached and uncached config reads")
+    parser.add_argument("-n", type=int, default=10000, help="Calls to get_config_value")
+    parser.add_argument("--modules", nargs="+", default=["events.redisstream", "utils.rediscache"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':<28} {'uncached':>10} {'cached':>10}")
+    uncached, cached = time_calls(args.n, False), time_calls(args.n, True)
+    print(f"{'get_config_value (us)':<28} {uncached * 1e6:>10.1f} {cached * 1e6:>10.1f}")
+    uncached = time_imports(args.modules, False, args.repeat)
+    cached = time_imports(args.modules, True, args.repeat)
+    print(f"{'import (ms)':<28} {uncached * 1000:>10.1f} {cached * 1000:>10.1f}")
@@ -0,0 +1,109 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+from events import events as events_module
+from events.codecs import MSGPACK, PICKLE, decode_event, encode_event
+from events.events import DetectionEvent, EventType
+from utils.common import time_ordered_id, uuid_factory, uuid_id
+
+
+@dataclass
+class BaselineEvent:
+    # GenericEvent as it was before the event id factories: no attribute hooks, ids from uuid_factory closures
+    timestamp: float = field(default=None)
+    uuid: str = field(default=None)
+    event_type: EventType = field(default=None)
+    correlations: dict = field(default_factory=dict)
+    prefix: str = "GENERIC-EVENT"
+    generic_model_data: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.timestamp = self.timestamp or time.time()
+        self.uuid = self.uuid or uuid_factory(self.prefix or "EVENT")()
+        self.event_type = self.event_type or EventType.GENERIC_EVENT
+
+
+def make_event(i):
+    return DetectionEvent({"id": f"DET-{i}", "bbox": [0.1, 0.2, 0.3, 0.4], "score": 0.9})
+
+
+def timed(f, n):
+    start = time.perf_counter()
+    f(n)
+    seconds = time.perf_counter() - start
+    # tracemalloc slows allocations down a lot, measure memory on a separate run
+    tracemalloc.start()
+    f(n)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def bench_ids(n):
+    return {
+        "uuid_factory": lambda n: [uuid_factory("DETECTION-EVENT")() for _ in range(n)],
+        "uuid_id": lambda n: [uuid_id("DETECTION-EVENT") for _ in range(n)],
+        "time_ordered_id": lambda n: [time_ordered_id("DETECTION-EVENT") for _ in range(n)],
+    }
+
+
+def bench_construction(n):
+    def construct(factory):
+        def f(n):
+            events_module.set_event_id_factory(factory)
+            try:
+                return [GenericEvent() for _ in range(n)]
+            finally:
+                events_module.set_event_id_factory(time_ordered_id)
+
+        return f
+
+    GenericEvent = events_module.GenericEvent
+    return {
+        "baseline event": lambda n: [BaselineEvent() for _ in range(n)],
+        "event uuid_id": construct(uuid_id),
+        "event time_ordered_id": construct(time_ordered_id),
+    }
+
+
+def bench_reads(n):
+    def read(event):
+        def f(n):
+            for _ in range(n):
+                event.uuid, event.timestamp, event.event_type, event.correlations
+
+        return f
+
+    return {"baseline 4 reads": read(BaselineEvent()), "event 4 reads": read(events_module.GenericEvent())}
+
+
+def bench_decode(n):
+    raw = {
+        codec: [encode_event(make_event(i), codec, compression=False) for i in range(n)]
+        for codec in (PICKLE, MSGPACK)
+    }
+    return {
+        "decode pickle": lambda n: [decode_event(b) for b in raw[PICKLE]],
+        "decode msgpack": lambda n: [decode_event(b) for b in raw[MSGPACK]],
+    }
+
+
+def run(n):
+    # Peak memory is measured while the result list is alive, so it includes the decoded events
+    print(f"{'case':<26} {'us/item':>9} {'peak KB':>10}")
+    for bench in (bench_ids, bench_construction, bench_reads, bench_decode):
+        for name, f in bench(n).items():
+            f(min(n, 1000))  # Warm up caches (event classes, codec lookups)
+            seconds, peak = timed(f, n)
+            print(f"{name:<26} {seconds / n * 1e6:>9.2f} {peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare event id generation, construction and decode costs")
+    parser.add_argument("-n", type=int, default=100000)
+    args = parser.parse_args()
+    run(args.n)
@@ -0,0 +1,65 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+import pickle
+import time
+
+from billiard import Pool, cpu_count
+
+from events.events import DetectionEvent
+from events.scan import ScanEngine, find_first_event, match_event
+
+
+def make_raw_events(n, payload_size):
+    events = [
+        DetectionEvent(
+            {"id": f"DET-{i}", "blob": b"\x00" * payload_size}, correlations={"stream_id": f"STREAM-{i}"}
+        )
+        for i in range(n)
+    ]
+    return [pickle.dumps(e) for e in events]
+
+
+def legacy_scan(raw_events, filters_dict):
+    # What source_event did before the scan engine: a new pool and three maps per batch
+    n = len(raw_events)
+    with Pool(min(n, cpu_count())) as pool:
+        events = pool.map(pickle.loads, raw_events)
+        matches = pool.starmap(match_event, zip(events, [filters_dict] * n))
+        return matches.index(True) if any(matches) else None
+
+
+def timed(f, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = f()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def run(sizes, payload_sizes, repeat):
+    print(f"{'events':>8} {'payload':>9} {'mode':>10} {'ms/scan':>10}")
+    for payload_size in payload_sizes:
+        for n in sizes:
+            raw_events = make_raw_events(n, payload_size)
+            filters_dict = {"correlations.stream_id": f"STREAM-{n - 1}"}  # Worst case: last event matches
+            modes = {
+                "legacy": lambda: legacy_scan(raw_events, filters_dict),
+                "serial": lambda: find_first_event(raw_events, filters_dict, "serial"),
+                "parallel": lambda: find_first_event(raw_events, filters_dict, "parallel"),
+                "auto": lambda: find_first_event(raw_events, filters_dict, "auto"),
+            }
+            ScanEngine.get_pool()  # Pool startup is paid once per process, keep it out of the timings
+            for mode, f in modes.items():
+                seconds, index = timed(f, repeat)
+                assert index == n - 1
+                print(f"{n:>8} {payload_size:>9} {mode:>10} {seconds * 1000:>10.2f}")
+    ScanEngine.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare stream scan modes used by source_event.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 128, 1000])
+    parser.add_argument("--payload-sizes", type=int, nargs="+", default=[0, 64 * 1024])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.payload_sizes, args.repeat)
@@ -0,0 +1,45 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+import json
+import time
+
+from events.monitor import StreamMonitor, monitor_consumer_groups, DEFAULT_MAXLEN, DEFAULT_RISK_RATIO
+from utils.configmanager import ConfigManager
+
+
+def print_table(reports):
+    print(
+        f"{'stream':<30} {'group':<30} {'length':>7} {'pending':>8} {'lag':>7} "
+        f"{'lag_ms':>9} {'rate/s':>8}  risk"
+    )
+    for r in reports:
+        lag = "-" if r["lag"] is None else r["lag"]
+        rate = "-" if r["growth_rate"] is None else f"{r['growth_rate']:.1f}"
+        risk = "TRIMMED" if r["trimmed"] else ("NEAR MAXLEN" if r["at_trim_risk"] else "")
+        print(
+            f"{r['stream']:<30} {r['group']:<30} {r['length']:>7} {r['pending']:>8} {lag:>7} "
+            f"{r['lag_ms']:>9} {rate:>8}  {risk}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report backlog and lag of the configured event consumers.")
+    parser.add_argument("--watch", type=float, default=0, help="Repeat every N seconds")
+    parser.add_argument("--json", action="store_true", help="Print one JSON document per line")
+    parser.add_argument("--maxlen", type=int, default=DEFAULT_MAXLEN)
+    parser.add_argument("--risk-ratio", type=float, default=DEFAULT_RISK_RATIO)
+    args = parser.parse_args()
+
+    consumers = ConfigManager.get_config_value("event_consumers")
+    group_configs = [consumer["consumer_group"] for consumer in consumers.values()]
+    monitor = StreamMonitor(maxlen=args.maxlen, risk_ratio=args.risk_ratio)
+    while True:
+        reports = monitor_consumer_groups(group_configs, monitor)
+        if args.json:
+            [print(json.dumps(report)) for report in reports]
+        else:
+            print_table(reports)
+        if not args.watch:
+            break
+        time.sleep(args.watch)
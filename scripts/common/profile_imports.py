@@ -0,0 +1,42 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["events.redisstream", "utils.rediscache", "database.mongo", "services.storage"]
+
+
+def profile_import(module):
+    # python -X importtime reports "import time: self [us] | cumulative | imported package" on stderr
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True
+    )
+    timings = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    error = output.stderr.strip().splitlines()[-1] if output.returncode else None
+    return timings, error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report per-module import cost in a fresh interpreter")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=15, help="Slowest dependencies to list per module")
+    parser.add_argument("--sort", choices=["self", "cumulative"], default="self")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        timings, error = profile_import(module)
+        if error:
+            print(f"{module}: import failed ({error})\n")
+            continue
+        total = next((cumulative for name, _, cumulative in timings if name == module), 0)
+        print(f"{module}: {total / 1000:.1f} ms")
+        key = 1 if args.sort == "self" else 2
+        for name, self_us, cumulative_us in sorted(timings, key=lambda t: t[key], reverse=True)[: args.top]:
+            print(f"  {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms cumulative  {name}")
+        print()
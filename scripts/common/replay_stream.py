@@ -0,0 +1,54 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import argparse
+import json
+import time
+from importlib import import_module
+
+from events.replay import DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE, replay
+
+
+def parse_filter(s):
+    key, value = s.split("=", 1)
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def load_handlers(path):
+    # module:attribute of a registered handlers dict, as passed to start_redis_consumer
+    module_name, attr = path.split(":")
+    return getattr(import_module(module_name), attr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a stream range to another stream or to handlers")
+    parser.add_argument("stream")
+    parser.add_argument("--start", help="Stream id or ISO datetime (default: first entry)")
+    parser.add_argument("--end", help="Stream id or ISO datetime (default: last entry)")
+    parser.add_argument("--target", help="Stream to re-produce the events to")
+    parser.add_argument("--handlers", help="module:attribute of a registered handlers dict")
+    parser.add_argument("--filter", action="append", default=[], help="attr.path=value, value parsed as JSON")
+    parser.add_argument("--event-type", action="append", help="EventType name, can be repeated")
+    parser.add_argument("--rate", type=float, help="Max events per second")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--maxlen", type=int, default=10000, help="Trim horizon of the target stream")
+    args = parser.parse_args()
+
+    start = time.time()
+    count = replay(
+        args.stream,
+        start=args.start,
+        end=args.end,
+        target=args.target,
+        registered_handlers=load_handlers(args.handlers) if args.handlers else None,
+        filters_dict=dict(parse_filter(f) for f in args.filter),
+        event_types=args.event_type,
+        rate=args.rate,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        maxlen=args.maxlen,
+    )
+    print(f"Replayed {count} events from {args.stream} in {time.time() - start:.1f}s")
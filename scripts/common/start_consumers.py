@@ -1,15 +1,121 @@
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
 
-from utils.configmanager import ConfigManager
+import argparse
+import math
+import time
 from importlib import import_module
 
+from events.monitor import StreamMonitor
+from events.redisstream import RedisStream
+from utils.configmanager import ConfigManager
+
+DEFAULT_INTERVAL = 15
+DEFAULT_BACKLOG_PER_WORKER = 100
+DEFAULT_SCALE_UP_COOLDOWN = 30
+DEFAULT_SCALE_DOWN_COOLDOWN = 300
 
-consumers = ConfigManager.get_config_value("event_consumers")
 
-for _, consumer in consumers.items():
+def start_consumer_task(consumer):
     consumer_module = import_module(consumer["consumer_module"])
     consumer_task = getattr(consumer_module, consumer["consumer_task"])
-    for _ in range(consumer["workers"]):
-        consumer_task.delay(consumer["consumer_group"])
-        print(f'Consumer started for {consumer["consumer_group"]}')
+    result = consumer_task.delay(consumer["consumer_group"])
+    print(f'Consumer started for {consumer["consumer_group"]}')
+    return result
+
+
+def start_consumers(consumers):
+    for _, consumer in consumers.items():
+        for _ in range(consumer["workers"]):
+            start_consumer_task(consumer)
+
+
+def desired_workers(backlog, growth_rate, autoscale_config, min_workers, max_workers):
+    backlog_per_worker = autoscale_config.get("backlog_per_worker", DEFAULT_BACKLOG_PER_WORKER)
+    desired = math.ceil(backlog / backlog_per_worker)
+    events_per_worker = autoscale_config.get("events_per_worker")  # Sustained events/s one worker handles
+    if events_per_worker and growth_rate:
+        desired = max(desired, math.ceil(growth_rate / events_per_worker))
+    return min(max_workers, max(min_workers, desired))
+
+
+class ConsumerSupervisor:
+    def __init__(self, name, consumer):
+        self.name = name
+        self.consumer = consumer
+        autoscale_config = consumer.get("autoscale") or {}
+        self.autoscale_config = autoscale_config
+        self.min_workers = autoscale_config.get("min_workers", consumer["workers"])
+        self.max_workers = autoscale_config.get("max_workers", consumer["workers"])
+        self.scale_up_cooldown = autoscale_config.get("scale_up_cooldown", DEFAULT_SCALE_UP_COOLDOWN)
+        self.scale_down_cooldown = autoscale_config.get("scale_down_cooldown", DEFAULT_SCALE_DOWN_COOLDOWN)
+        self.tasks = []
+        self.last_scaled = 0
+        # Events pending on a retired consumer are only taken over by the recovery sweep of the others
+        self.can_scale_down = bool(consumer["consumer_group"].get("recovery"))
+        if not self.can_scale_down and self.max_workers > self.min_workers:
+            print(f"{name} has no recovery config, its consumers will be scaled up but never down")
+
+    def prune(self):
+        # Consumer loops never return, a ready task has crashed or was revoked elsewhere
+        finished = [t for t in self.tasks if t.ready()]
+        if finished:
+            print(f"{len(finished)} consumers for {self.name} are gone, replacing them")
+        self.tasks = [t for t in self.tasks if not t.ready()]
+
+    def scale_up(self, n):
+        self.tasks += [start_consumer_task(self.consumer) for _ in range(n)]
+
+    def scale_down(self, n):
+        for task in self.tasks[-n:]:
+            task.revoke(terminate=True, signal="SIGTERM")
+        self.tasks = self.tasks[:-n]
+
+    def step(self, reports):
+        self.prune()
+        backlog = sum(r["backlog"] for r in reports)
+        growth_rate = sum(r["growth_rate"] or 0 for r in reports)
+        desired = desired_workers(
+            backlog, growth_rate, self.autoscale_config, self.min_workers, self.max_workers
+        )
+        current = len(self.tasks)
+        now = time.time()
+
+        if current < self.min_workers:
+            self.scale_up(self.min_workers - current)
+        elif desired > current and now - self.last_scaled >= self.scale_up_cooldown:
+            self.scale_up(desired - current)
+        elif self.can_scale_down and desired < current and now - self.last_scaled >= self.scale_down_cooldown:
+            self.scale_down(1)  # Retire gradually, bursts usually come back
+        else:
+            return current
+        print(f"Scaled {self.name} from {current} to {len(self.tasks)} consumers (backlog: {backlog})")
+        self.last_scaled = now
+        return len(self.tasks)
+
+
+def supervise(consumers, interval=DEFAULT_INTERVAL):
+    broker = RedisStream.get_broker()
+    monitor = StreamMonitor()
+    supervisors = [ConsumerSupervisor(name, consumer) for name, consumer in consumers.items()]
+    while True:
+        for supervisor in supervisors:
+            try:
+                reports = monitor.group_report(broker, supervisor.consumer["consumer_group"])
+                supervisor.step(reports)
+            except Exception as e:
+                print(f"Can't scale consumers for {supervisor.name}: {e}")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the configured event consumers.")
+    parser.add_argument("--supervise", action="store_true", help="Keep running and autoscale consumers")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    args = parser.parse_args()
+
+    consumers = ConfigManager.get_config_value("event_consumers")
+    if args.supervise:
+        supervise(consumers, args.interval)
+    else:
+        start_consumers(consumers)
@@ -1,18 +1,18 @@
 import io
 
-import boto3
-
 from utils.configmanager import ConfigManager
 
 
 class S3:
     __bucket = None
 
-    def __init__(self, config=ConfigManager.get_config_value("aws", "s3")):
+    def __init__(self, config=None):
         self.__bucket = self._get_bucket(config)
 
     def _get_bucket(self, config=None):
         if not self.__bucket:
+            import boto3  # Slow to import, only paid by processes that use S3
+
             config = config or ConfigManager.get_config_value("aws", "s3")
             self.__bucket = boto3.resource("s3").Bucket(config["bucket_name"])
         return self.__bucket
@@ -0,0 +1,47 @@
+import pickle
+
+import pytest
+from PIL import Image
+
+from events.claimcheck import CLAIMS_ATTR, ClaimCheckConfig, offload_payloads
+from events.codecs import encode_event, decode_event
+from events.events import OCREvent, FileEvent, FrameEvent
+
+
+@pytest.fixture(autouse=True)
+def claim_check_config(tmp_path):
+    ClaimCheckConfig.set_config({"threshold": 10, "store": "local", "path": str(tmp_path)})
+    yield
+    ClaimCheckConfig.set_config(None)
+
+
+@pytest.mark.parametrize("codec", ["pickle", "msgpack"])
+@pytest.mark.parametrize(
+    "event, name",
+    [
+        (OCREvent("sig", b"x" * 100, "user_one@sample.com"), "data"),
+        (FileEvent("/uploads/receipt.jpg", "user_one@sample.com", data=b"\x00" * 100), "data"),
+        (FrameEvent(Image.new("RGB", (8, 8), "red"), "worker-1", "STREAM-1"), "frame"),
+    ],
+)
+def test_offloaded_payload_roundtrip(codec, event, name):
+    decoded = decode_event(encode_event(offload_payloads(event), codec=codec, compression=False))
+    assert name in decoded.__dict__[CLAIMS_ATTR]
+    assert isinstance(decoded, type(event))
+    assert getattr(decoded, name) == getattr(event, name)
+    assert CLAIMS_ATTR not in decoded.__dict__
+    assert type(decoded) is type(event)
+    assert vars(decoded) == vars(event)
+
+
+def test_offloaded_events_pickle_as_the_regular_class():
+    offloaded = offload_payloads(OCREvent("sig", b"x" * 100, "user_one@sample.com"))
+    restored = pickle.loads(pickle.dumps(offloaded))
+    assert type(restored) is OCREvent
+    assert CLAIMS_ATTR in restored.__dict__
+
+
+def test_small_events_are_not_tracked():
+    event = OCREvent("sig", b"x", "user_one@sample.com")
+    assert offload_payloads(event) is event
+    assert type(decode_event(encode_event(event, codec="pickle", compression=False))) is OCREvent
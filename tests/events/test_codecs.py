@@ -0,0 +1,48 @@
+import pickle
+
+import pytest
+
+from events.codecs import encode_event, decode_event, HEADER_VERSION, MSGPACK, ZLIB
+from events.events import EventType, GenericEvent, FileEvent, DetectionEvent
+
+
+def make_events():
+    return [
+        GenericEvent(generic_model_data={"name": "receipt", "bbox": (1, 2, 3, 4)}),
+        FileEvent("/uploads/receipt.jpg", "user_one@sample.com", data=b"\x00" * 8192),
+        DetectionEvent({"id": "DET-1", "score": 0.98}, correlations={"stream_id": "STREAM-1"}),
+    ]
+
+
+def test_plain_pickle_is_written_without_header():
+    event = GenericEvent()
+    encoded = encode_event(event, codec="pickle", compression=False)
+    assert encoded == pickle.dumps(event)
+
+
+def test_legacy_pickles_are_decoded():
+    event = GenericEvent(generic_model_data={"a": 1})
+    assert decode_event(pickle.dumps(event)) == event
+
+
+@pytest.mark.parametrize("codec", ["pickle", "msgpack"])
+@pytest.mark.parametrize("compression", [False, "zlib"])
+def test_roundtrip(codec, compression):
+    for event in make_events():
+        decoded = decode_event(encode_event(event, codec=codec, compression=compression))
+        assert type(decoded) is type(event)
+        assert vars(decoded) == vars(event)
+
+
+def test_header_records_codec_and_compression():
+    event = make_events()[1]
+    encoded = encode_event(event, codec="msgpack", compression="zlib", compression_threshold=0)
+    assert tuple(encoded[:3]) == (HEADER_VERSION, MSGPACK, ZLIB)
+    assert len(encoded) < len(pickle.dumps(event))
+
+
+def test_event_type_and_tuples_survive_msgpack():
+    event = make_events()[0]
+    decoded = decode_event(encode_event(event, codec="msgpack", compression=False))
+    assert decoded.event_type is EventType.GENERIC_EVENT
+    assert decoded.generic_model_data["bbox"] == (1, 2, 3, 4)
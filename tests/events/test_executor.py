@@ -0,0 +1,84 @@
+import threading
+
+from events.executor import HandlerExecutor
+from events.metrics import NullMetrics
+from events.redisstream import timed_call_handler
+
+
+def blocking_handler(release, calls):
+    def handler(stream_name, event, event_id):
+        calls.append(event_id)
+        if not release.wait(5):
+            raise TimeoutError()
+
+    return handler
+
+
+def submit(executor, handler, event_id, stream_name="stream"):
+    return executor.submit(timed_call_handler, stream_name, (handler, None, event_id, [event_id]))
+
+
+def test_acks_only_after_handler_completes():
+    executor = HandlerExecutor({"workers": 2})
+    release, calls = threading.Event(), []
+    future = submit(executor, blocking_handler(release, calls), "1-0")
+    assert executor.collect(NullMetrics()) == {}
+    assert executor.in_flight_ids() == {"stream": ["1-0"]}
+    release.set()
+    future.result(5)
+    assert executor.collect(NullMetrics()) == {"stream": ["1-0"]}
+    assert executor.in_flight_ids() == {}
+    executor.shutdown()
+
+
+def test_failed_handlers_are_not_acked():
+    executor = HandlerExecutor({"workers": 2})
+
+    def failing(stream_name, event, event_id):
+        raise ValueError("poison")
+
+    submit(executor, failing, "1-0").result(5)
+    assert executor.collect(NullMetrics()) == {}
+    assert executor.in_flight_ids() == {}
+    executor.shutdown()
+
+
+def test_capacity_and_backpressure():
+    executor = HandlerExecutor({"workers": 2, "max_in_flight": 2})
+    release, calls = threading.Event(), []
+    handler = blocking_handler(release, calls)
+    submit(executor, handler, "1-0")
+    submit(executor, handler, "2-0")
+    assert executor.capacity() == 0
+    waiter = threading.Thread(target=executor.wait_for_capacity)
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()  # Blocked until a handler finishes
+    release.set()
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert executor.capacity() > 0
+    executor.shutdown()
+
+
+def test_ordering_key_keeps_order_within_a_key():
+    executor = HandlerExecutor({"workers": 4, "ordering_key": "correlations.key"})
+    seen = []
+
+    class Event:
+        def __init__(self, key, i):
+            self.correlations = {"key": key}
+            self.i = i
+
+    def handler(stream_name, event, event_id):
+        seen.append((event.correlations["key"], event.i))
+
+    futures = [
+        executor.submit(timed_call_handler, "stream", (handler, Event(i % 3, i), f"{i}-0", [f"{i}-0"]))
+        for i in range(30)
+    ]
+    [f.result(5) for f in futures]
+    for key in range(3):
+        assert [i for k, i in seen if k == key] == list(range(key, 30, 3))
+    assert len(executor.collect(NullMetrics())["stream"]) == 30
+    executor.shutdown()
@@ -0,0 +1,29 @@
+import socket
+import urllib.request
+
+from events.metrics import ConsumerMetrics
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def test_consumers_share_the_metrics_port():
+    port = free_port()
+    first = ConsumerMetrics("group", "first", {"prometheus_port": port})
+    second = ConsumerMetrics("group", "second", {"prometheus_port": port})
+    first.observe("handler_seconds", 0.01, "stream", "Event")
+    second.observe("handler_seconds", 0.02, "stream", "Event")
+    text = urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=5).read().decode()
+    assert 'consumer="first"' in text and 'consumer="second"' in text
+    assert text.count("# TYPE stream_consumer_handler_seconds histogram") == 1
+
+
+def test_port_taken_by_another_process_does_not_raise(capsys):
+    with socket.socket() as s:
+        s.bind(("", 0))
+        s.listen()
+        ConsumerMetrics("group", "consumer", {"prometheus_port": s.getsockname()[1]})
+    assert "Can't serve consumer metrics" in capsys.readouterr().out
@@ -0,0 +1,51 @@
+import time
+
+import fakeredis
+import pytest
+
+from events.recovery import dead_letter_stream, sweep_pending
+
+STREAM = "detections"
+
+
+@pytest.fixture
+def broker():
+    broker = fakeredis.FakeStrictRedis()
+    broker.xgroup_create(STREAM, "group", mkstream=True)
+    return broker
+
+
+def group_config(**recovery):
+    return {"name": "group", "streams": [STREAM], "recovery": {"min_idle_time": 0, **recovery}}
+
+
+def test_failing_event_is_dead_lettered_after_max_deliveries(broker):
+    config = group_config(max_deliveries=3)
+    event_id = broker.xadd(STREAM, {"EVENT-1": b"payload"})
+    broker.xreadgroup("group", "crashed", {STREAM: ">"})
+    # The handler keeps failing, so the event is never acked and gets swept again
+    deliveries = 1
+    while True:
+        time.sleep(0.01)  # Past min_idle_time
+        items = sweep_pending(broker, config, "consumer")
+        if not items:
+            break
+        assert items == [(STREAM, [(event_id, {b"EVENT-1": b"payload"})])]
+        deliveries += 1
+    assert deliveries == 3
+    assert broker.xpending(STREAM, "group")["pending"] == 0
+    [(_, fields)] = broker.xrange(dead_letter_stream(STREAM, config["recovery"]))
+    assert fields[b"EVENT-1"] == b"payload"
+    assert fields[b"__source_id__"] == event_id
+    assert fields[b"__deliveries__"] == b"3"
+
+
+def test_in_flight_entries_are_not_reclaimed(broker):
+    config = group_config(max_deliveries=1)
+    event_id = broker.xadd(STREAM, {"EVENT-1": b"payload"})
+    broker.xreadgroup("group", "consumer", {STREAM: ">"})
+    config["recovery"]["min_idle_time"] = 50
+    broker.xclaim(STREAM, "group", "consumer", 0, [event_id], idle=1000, justid=True)
+    assert sweep_pending(broker, config, "other", in_flight={STREAM: [event_id]}) == []
+    assert broker.xpending(STREAM, "group")["pending"] == 1
+    assert not broker.exists(dead_letter_stream(STREAM, config["recovery"]))
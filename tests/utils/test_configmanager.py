@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from utils.configmanager import ConfigManager
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.yml"
+    path.write_text("cache:\n  redis:\n    host: ${CACHE_HOST}\n    port: 6379\n  enabled: 'yes'\n")
+    monkeypatch.setenv("CACHE_HOST", "redis.local")
+    monkeypatch.setenv("DEFAULT_CONFIG", str(path))
+    ConfigManager.configure(cache=True, lazy_env=False, check_interval=0)
+    yield path
+    ConfigManager.configure(cache=True, lazy_env=False, check_interval=1.0)
+
+
+def test_values_are_resolved_and_copied(config_file):
+    redis_config = ConfigManager.get_config_value("cache", "redis")
+    assert redis_config == {"host": "redis.local", "port": 6379}
+    redis_config["port"] = 1
+    assert ConfigManager.get_config_value("cache", "redis")["port"] == 6379
+
+
+def test_file_is_reloaded_when_it_changes(config_file):
+    assert ConfigManager.get_int("cache.redis.port") == 6379
+    config_file.write_text("cache:\n  redis:\n    port: 6380\n")
+    stat = os.stat(config_file)
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert ConfigManager.get_int("cache.redis.port") == 6380
+
+
+def test_typed_accessors(config_file):
+    assert ConfigManager.get_bool("cache.enabled") is True
+    assert ConfigManager.get_str("cache.redis.port") == "6379"
+    assert ConfigManager.get_int("cache.redis.db", 0) == 0
+    with pytest.raises(KeyError):
+        ConfigManager.get("cache.redis.db")
+
+
+def test_lazy_env(config_file, monkeypatch):
+    monkeypatch.delenv("CACHE_HOST")
+    ConfigManager.configure(lazy_env=True)
+    assert ConfigManager.get_int("cache.redis.port") == 6379
+    with pytest.raises(KeyError):
+        ConfigManager.get_config_value("cache", "redis")
+    monkeypatch.setenv("CACHE_HOST", "other.local")
+    assert ConfigManager.get_str("cache.redis.host") == "other.local"
@@ -0,0 +1,58 @@
+import time
+
+import fakeredis
+
+from utils.localcache import INVALIDATE_ALL, LocalCache, start_invalidation_listener
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_published_invalidation_evicts_entry():
+    client = fakeredis.FakeStrictRedis()
+    local = LocalCache()
+    thread = start_invalidation_listener(local, client, channel="cache:invalidate")
+    try:
+        local.put("users", {"a": 1}, 10, local.generation, complete=True)
+        local.put("others", {"b": 2}, 10, local.generation, complete=True)
+        wait_for(lambda: client.publish("cache:invalidate", "users"))  # Once the listener is subscribed
+        assert wait_for(lambda: local.get_mapping("users") is None)
+        assert local.get_mapping("others") == {"b": 2}
+        client.publish("cache:invalidate", INVALIDATE_ALL)
+        assert wait_for(lambda: local.get_mapping("others") is None)
+    finally:
+        thread.stop()
+
+
+def test_fetch_racing_an_invalidation_is_not_cached():
+    local = LocalCache()
+    generation = local.generation  # Read before fetching from Redis
+    local.invalidate("users")  # Another process wrote meanwhile
+    local.put("users", {"a": "stale"}, 10, generation, complete=True)
+    assert local.get_mapping("users") is None
+    local.put("users", {"a": "fresh"}, 10, local.generation, complete=True)
+    assert local.get_mapping("users") == {"a": "fresh"}
+
+
+def test_partial_entries_and_limits():
+    local = LocalCache(max_items=2, max_bytes=100)
+    local.put("users", {"a": 1}, 10, local.generation)
+    assert local.get_mapping("users") is None  # Only some fields are cached
+    assert local.get_values("users", ["a", "b"]) == {"a": 1}
+    local.put("b", {"x": 1}, 10, local.generation, complete=True)
+    local.put("c", {"x": 1}, 10, local.generation, complete=True)
+    assert local.get_values("users", ["a"]) == {}  # Evicted, least recently used
+    local.put("big", {"x": 1}, 1000, local.generation, complete=True)
+    assert local.get_mapping("big") is None
+
+
+def test_entries_expire():
+    local = LocalCache(ttl=0.05)
+    local.put("users", {"a": 1}, 10, local.generation, complete=True)
+    assert local.get_mapping("users") == {"a": 1}
+    time.sleep(0.1)
+    assert local.get_mapping("users") is None
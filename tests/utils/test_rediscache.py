@@ -0,0 +1,117 @@
+import pickle
+
+import fakeredis
+import pytest
+
+from utils.rediscache import (
+    RedisCache,
+    TAG_PREFIX,
+    coerce_obj,
+    decode_value,
+    encode_value,
+    invalidate_key,
+    redis_cachable,
+)
+
+TYPES_MAPPING = "RedisCache__types_mapping"
+VALUES = ["text", "ünïcode", "", 42, -3, 1.5, b"\x00\xff raw", {"a": [1, 2]}, (1, "b"), None]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    client = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr("utils.rediscache.ClientRegistry.redis", lambda name, config: client)
+    RedisCache.init_client({"host": "localhost", "port": 6379, "db": 0, "password": None})
+    RedisCache.init_local_cache({})
+    RedisCache.init_tagged_values(True)
+    return RedisCache()
+
+
+@pytest.fixture
+def untagged_cache(cache):
+    RedisCache.init_tagged_values(False)
+    yield cache
+    RedisCache.init_tagged_values(True)
+
+
+def write_legacy(cache, name, mapping):
+    # As written before type tags: raw values plus a pickled blob with their types
+    client = cache.get_client()
+    types_mapping, serialized = {}, {}
+    for k, v in mapping.items():
+        pickled = type(v) not in (str, int, bytes, float)
+        serialized[k] = pickle.dumps(v) if pickled else v
+        types_mapping[k] = "pickled" if pickled else type(v).__name__
+    serialized[TYPES_MAPPING] = pickle.dumps(types_mapping)
+    client.hset(name, mapping=serialized)
+
+
+def read_legacy(cache, name):
+    # As read before type tags, the type blob has to be there and every value listed in it
+    mapping = {k.decode("utf-8"): v for k, v in cache.get_client().hgetall(name).items()}
+    types_mapping = pickle.loads(mapping.pop(TYPES_MAPPING))
+    return {k: coerce_obj(v, types_mapping[k]) if k in types_mapping else v for k, v in mapping.items()}
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_tagged_roundtrip(cache, value):
+    encoded = encode_value(value)
+    assert encoded.startswith(TAG_PREFIX)
+    assert decode_value(encoded) == value
+    assert type(decode_value(encoded)) is type(value)
+    cache.set_value("tagged", "key", value)
+    assert cache.get_value("tagged", "key") == value
+    assert not cache.value_exists("tagged", TYPES_MAPPING)
+
+
+def test_tagged_mapping(cache):
+    mapping = {f"k{i}": v for i, v in enumerate(VALUES)}
+    cache.set_mapping("tagged", mapping)
+    assert cache.get_mapping("tagged") == mapping
+    assert cache.get_values("tagged", ["k3", "k0", "missing"]) == [42, "text", None]
+
+
+def test_legacy_hash(cache):
+    mapping = {"s": "text", "i": 42, "f": 1.5, "b": b"\x00\xff", "p": {"a": [1, 2]}}
+    write_legacy(cache, "legacy", mapping)
+    assert cache.get_mapping("legacy") == mapping
+    assert cache.get_values("legacy", ["i", "p", "missing"]) == [42, {"a": [1, 2]}, None]
+    assert sorted(cache.get_all_keys_in_mapping("legacy")) == sorted(mapping)
+
+
+def test_mixed_hash(cache):
+    write_legacy(cache, "mixed", {"old_int": 7, "old_obj": [1, 2], "replaced": "old"})
+    cache.set_mapping("mixed", {"new_int": 8, "new_obj": {"x": 1}, "replaced": 3.5})
+    expected = {"old_int": 7, "old_obj": [1, 2], "new_int": 8, "new_obj": {"x": 1}, "replaced": 3.5}
+    assert cache.get_mapping("mixed") == expected
+    assert cache.get_values("mixed", ["replaced", "old_int", "new_obj"]) == [3.5, 7, {"x": 1}]
+
+
+def test_untagged_writes_are_readable_by_old_readers(untagged_cache):
+    write_legacy(untagged_cache, "rollout", {"old": 1, "replaced": "old"})
+    untagged_cache.set_mapping("rollout", {"new": {"x": 1}, "replaced": 2.5, "raw": b"\x00raw"})
+    expected = {"old": 1, "replaced": 2.5, "new": {"x": 1}, "raw": b"\x00raw"}
+    assert read_legacy(untagged_cache, "rollout") == expected
+    assert untagged_cache.get_mapping("rollout") == expected
+    untagged_cache.set_value("fresh", "key", 42)
+    assert read_legacy(untagged_cache, "fresh") == {"key": 42}
+
+
+def test_cached_entries_dont_clash_with_old_decorators():
+    client, calls = fakeredis.FakeStrictRedis(), []
+    client.set("squares-3", b"bare result")  # As cached by redis_cachable before entries had a format
+
+    @redis_cachable(client, "squares")
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    @invalidate_key(client, "squares")
+    def update(x):
+        return x
+
+    assert square(3) == 9 and square(3) == 9 and calls == [3]
+    assert client.get("squares-3") == b"bare result"
+    update(3)
+    assert not client.exists("squares-3") and not client.exists("squares:v2-3")
+    assert square(3) == 9 and calls == [3, 3]
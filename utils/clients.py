@@ -0,0 +1,260 @@
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+import json
+import os
+import threading
+
+from utils.configmanager import ConfigManager
+
+# Pool settings come from the optional "clients" config section: "default" applies to every client and
+# entries named like the clients ("events-stream", "cache", "mongo", "elasticsearch", ...) override it.
+DEFAULT_OPTIONS = {
+    "max_connections": 50,
+    "health_check_interval": 30,  # Seconds a connection can sit idle before it's checked with a PING
+    "socket_keepalive": True,
+    "socket_connect_timeout": 5,
+    "socket_timeout": None,  # Stream consumers block on XREADGROUP, a short timeout would break them
+    "blocking": False,  # Wait up to pool_timeout for a free connection instead of failing right away
+    "pool_timeout": 5,
+}
+
+
+class RegisteredClient:
+    def __init__(self, kind, client, options, usage=None):
+        self.kind = kind
+        self.client = client
+        self.options = options
+        self.usage = usage
+
+
+class ClientRegistry:
+    __clients = {}
+    __config = None
+    __pid = os.getpid()
+    __lock = threading.Lock()
+
+    @classmethod
+    def get_config(cls):
+        if cls.__config is None:
+            cls.__config = ConfigManager.get_config().get("clients") or {}
+        return cls.__config
+
+    @classmethod
+    def set_config(cls, config):
+        cls.__config = config
+
+    @classmethod
+    def options(cls, name):
+        config = cls.get_config()
+        return {**DEFAULT_OPTIONS, **(config.get("default") or {}), **(config.get(name) or {})}
+
+    @classmethod
+    def reset(cls):
+        # Sockets and pool threads are not usable across forks, children build their own clients
+        cls.__clients = {}
+        cls.__pid = os.getpid()
+
+    @classmethod
+    def get(cls, name, connection_config, factory):
+        # Clients are shared by name and connection parameters, a call with another config gets its own
+        if cls.__pid != os.getpid():
+            cls.reset()
+        key = (name, connection_key(connection_config))
+        registered = cls.__clients.get(key)
+        if registered is None:
+            with cls.__lock:
+                registered = cls.__clients.get(key)
+                if registered is None:
+                    registered = factory(cls.options(name))
+                    cls.__clients[key] = registered
+        return registered.client
+
+    @classmethod
+    def redis(cls, name, redis_config):
+        return cls.get(name, redis_config, lambda options: make_redis_client(redis_config, options))
+
+    @classmethod
+    def async_redis(cls, name, redis_config):
+        return cls.get(name, redis_config, lambda options: make_async_redis_client(redis_config, options))
+
+    @classmethod
+    def mongo(cls, name, db_config):
+        # The database is picked from the client, it's not part of the connection
+        connection_config = {k: v for k, v in db_config.items() if k != "db"}
+        return cls.get(name, connection_config, lambda options: make_mongo_client(db_config, options))
+
+    @classmethod
+    def elasticsearch(cls, name, db_config):
+        return cls.get(name, db_config, lambda options: make_es_client(db_config, options))
+
+    @classmethod
+    def stats(cls):
+        if cls.__pid != os.getpid():
+            return {}
+        stats, seen = {}, {}
+        for (name, _), registered in list(cls.__clients.items()):
+            seen[name] = seen.get(name, 0) + 1
+            label = name if seen[name] == 1 else f"{name}#{seen[name]}"
+            stats[label] = client_stats(registered)
+        return stats
+
+
+os.register_at_fork(after_in_child=ClientRegistry.reset)
+
+
+def connection_key(config):
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+def redis_client_name(redis_config):
+    return "redis://{}:{}/{}".format(redis_config["host"], redis_config["port"], redis_config["db"])
+
+
+def redis_pool_kwargs(redis_config, options):
+    return dict(
+        host=redis_config["host"],
+        port=redis_config["port"],
+        db=redis_config["db"],
+        password=redis_config["password"],
+        max_connections=options["max_connections"],
+        health_check_interval=options["health_check_interval"],
+        socket_keepalive=options["socket_keepalive"],
+        socket_connect_timeout=options["socket_connect_timeout"],
+        socket_timeout=options["socket_timeout"],
+    )
+
+
+def make_redis_client(redis_config, options):
+    import redis
+
+    kwargs = redis_pool_kwargs(redis_config, options)
+    if options["blocking"]:
+        pool = redis.BlockingConnectionPool(timeout=options["pool_timeout"], **kwargs)
+    else:
+        pool = redis.ConnectionPool(**kwargs)
+    return RegisteredClient("redis", redis.StrictRedis(connection_pool=pool), options)
+
+
+def make_async_redis_client(redis_config, options):
+    import redis.asyncio as aioredis
+
+    kwargs = redis_pool_kwargs(redis_config, options)
+    if options["blocking"]:
+        pool = aioredis.BlockingConnectionPool(timeout=options["pool_timeout"], **kwargs)
+    else:
+        pool = aioredis.ConnectionPool(**kwargs)
+    return RegisteredClient("redis", aioredis.StrictRedis(connection_pool=pool), options)
+
+
+class PoolUsage:
+    # Fed by pymongo's connection pool events, pymongo doesn't expose pool usage otherwise
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+
+
+def make_pool_listener(usage):
+    from pymongo import monitoring
+
+    class PoolUsageListener(monitoring.ConnectionPoolListener):
+        def connection_created(self, event):
+            usage.created += 1
+
+        def connection_closed(self, event):
+            usage.closed += 1
+
+        def connection_checked_out(self, event):
+            usage.checked_out += 1
+
+        def connection_checked_in(self, event):
+            usage.checked_out -= 1
+
+        def connection_check_out_failed(self, event):
+            usage.checkout_failures += 1
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_cleared(self, event):
+            pass
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_ready(self, event):
+            pass
+
+        def connection_check_out_started(self, event):
+            pass
+
+    return PoolUsageListener()
+
+
+def make_mongo_client(db_config, options):
+    from pymongo import MongoClient
+    from utils.common import make_url
+
+    usage = PoolUsage()
+    client = MongoClient(
+        make_url(db_config, include_db=False),
+        connect=False,
+        maxPoolSize=options["max_connections"],
+        heartbeatFrequencyMS=options["health_check_interval"] * 1000,
+        connectTimeoutMS=options["socket_connect_timeout"] * 1000,
+        waitQueueTimeoutMS=options["pool_timeout"] * 1000 if options["blocking"] else None,
+        event_listeners=[make_pool_listener(usage)],
+    )
+    return RegisteredClient("mongo", client, options, usage)
+
+
+def make_es_client(db_config, options):
+    import elasticsearch
+    from elasticsearch import Elasticsearch
+
+    if elasticsearch.VERSION[0] >= 8:
+        pool_size = {"connections_per_node": options["max_connections"]}
+    else:
+        pool_size = {"maxsize": options["max_connections"]}
+    client = Elasticsearch(db_config["hosts"], **pool_size)
+    return RegisteredClient("elasticsearch", client, options)
+
+
+def client_stats(registered):
+    stats = {"kind": registered.kind, "max_connections": registered.options["max_connections"]}
+    if registered.kind == "redis":
+        pool = registered.client.connection_pool
+        if isinstance(getattr(pool, "_connections", None), list):  # BlockingConnectionPool
+            idle = sum(1 for c in list(pool.pool.queue) if c is not None)
+            stats.update(created=len(pool._connections), in_use=len(pool._connections) - idle, idle=idle)
+        else:
+            in_use = len(getattr(pool, "_in_use_connections", ()))
+            idle = len(getattr(pool, "_available_connections", ()))
+            stats.update(created=in_use + idle, in_use=in_use, idle=idle)
+    elif registered.kind == "mongo":
+        usage = registered.usage
+        stats.update(
+            created=usage.created - usage.closed,
+            in_use=usage.checked_out,
+            idle=usage.created - usage.closed - usage.checked_out,
+            checkout_failures=usage.checkout_failures,
+        )
+    if "in_use" in stats and stats["max_connections"]:
+        stats["usage_ratio"] = stats["in_use"] / stats["max_connections"]
+    return stats
+
+
+def prometheus_text():
+    stats = sorted(ClientRegistry.stats().items())
+    lines = []
+    for metric in ("in_use", "idle", "max_connections"):
+        lines.append(f"# TYPE client_pool_{metric} gauge")
+        for name, client in stats:
+            if metric in client:
+                labels = f'client="{name}",kind="{client["kind"]}"'
+                lines.append(f"client_pool_{metric}{{{labels}}} {client[metric]}")
+    return "\n".join(lines) + "\n"
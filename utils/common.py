@@ -1,5 +1,8 @@
 # pylint: disable=import-error
 from http.client import responses
+import itertools
+import os
+import time
 import uuid
 from functools import wraps
 
@@ -45,6 +48,31 @@ def uuid_factory(name):
     return lambda: prefix + str(uuid.uuid4())
 
 
+def uuid_id(prefix):
+    return "%s-%s" % (prefix, uuid.uuid4())
+
+
+def _reset_id_node():
+    global _id_node, _id_counter
+    _id_node = os.urandom(4).hex()
+    _id_counter = itertools.count()
+
+
+_reset_id_node()
+os.register_at_fork(after_in_child=_reset_id_node)
+
+
+def time_ordered_id(prefix):
+    # <prefix>-<ns since epoch>-<random per process><counter>: sorts by creation time and, unlike uuid4,
+    # doesn't need an urandom call for every id
+    return "%s-%016x-%s%06x" % (prefix, time.time_ns(), _id_node, next(_id_counter) & 0xFFFFFF)
+
+
+def chunks(items, size):
+    items = list(items)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
 def extract_attr(item, attr_name):
     attr_names = attr_name.split(".")
     for name in attr_names:
@@ -1,44 +1,179 @@
 # pylint: disable=import-error
 import os
+import signal
+import threading
+import time
 import yaml
 import json
 
+DEFAULT_CHECK_INTERVAL = 1.0  # Seconds between mtime checks of a cached config file
+MISSING = object()
+TRUE_STRINGS = ("1", "true", "yes", "on")
+FALSE_STRINGS = ("0", "false", "no", "off", "")
+
+
+class CachedConfig:
+    def __init__(self, mtime, config):
+        self.mtime = mtime
+        self.config = config
+        self.next_check = 0
+
 
 class ConfigManager:
+    # Config files are parsed once per process and reloaded when their mtime changes or on reload().
+    # Callers get copies, so they can't change the cached config for everyone else.
+    __cache = {}
+    __lock = threading.RLock()
+    __options = {"cache": True, "lazy_env": False, "check_interval": DEFAULT_CHECK_INTERVAL}
+
+    @classmethod
+    def configure(cls, **options):
+        # cache: False parses the file on every call. lazy_env: True resolves ${ENV} values when they're read
+        # instead of when the file is parsed, so unset variables only fail the lookups that need them.
+        cls.__options.update(options)
+        cls.reload()
+
+    @classmethod
+    def reload(cls):
+        with cls.__lock:
+            cls.__cache = {}
+
+    @classmethod
+    def reload_on_sighup(cls):
+        previous = signal.getsignal(signal.SIGHUP)
+
+        def handler(signum, frame):
+            cls.reload()
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(signal.SIGHUP, handler)
+
     @classmethod
     def get_config(cls, config_file=None):
-        config_file = config_file or os.environ["DEFAULT_CONFIG"]
-        config = cls.__load_config(config_file)
-        return config
+        return cls.__copy(cls.__get_cached(config_file))
 
     @classmethod
     def get_config_value(cls, component, value=None, config_file=None):
-        config = cls.get_config(config_file)
-        return config[component][value] if value is not None else config[component]
+        config = cls.__get_cached(config_file)
+        return cls.__copy(config[component][value] if value is not None else config[component])
+
+    @classmethod
+    def get(cls, path, default=MISSING, config_file=None):
+        # Dotted path lookup, e.g. get("events-stream.broker.port", 6379)
+        node = cls.__get_cached(config_file)
+        for key in path.split("."):
+            if not isinstance(node, dict) or key not in node:
+                if default is MISSING:
+                    raise KeyError(path)
+                return default
+            node = node[key]
+        return cls.__copy(node)
+
+    @classmethod
+    def get_str(cls, path, default=MISSING, config_file=None):
+        value = cls.get(path, default, config_file)
+        return value if value is None else str(value)
+
+    @classmethod
+    def get_int(cls, path, default=MISSING, config_file=None):
+        value = cls.get(path, default, config_file)
+        return value if value is None else int(value)
+
+    @classmethod
+    def get_float(cls, path, default=MISSING, config_file=None):
+        value = cls.get(path, default, config_file)
+        return value if value is None else float(value)
+
+    @classmethod
+    def get_bool(cls, path, default=MISSING, config_file=None):
+        value = cls.get(path, default, config_file)
+        if isinstance(value, str):
+            if value.lower() not in TRUE_STRINGS + FALSE_STRINGS:
+                raise ValueError("Can't read {} as a boolean: {}".format(path, value))
+            return value.lower() in TRUE_STRINGS
+        return value if value is None else bool(value)
+
+    @classmethod
+    def get_list(cls, path, default=MISSING, config_file=None):
+        value = cls.get(path, default, config_file)
+        if isinstance(value, str):
+            return [v.strip() for v in value.split(",") if v.strip()]  # e.g. hosts from an env variable
+        return value if value is None else list(value)
+
+    @classmethod
+    def get_dict(cls, path, default=MISSING, config_file=None):
+        value = cls.get(path, default, config_file)
+        return value if value is None else dict(value)
+
+    @classmethod
+    def __copy(cls, node):
+        return copy_config(node, resolve_env=cls.__options["lazy_env"])
+
+    @classmethod
+    def __get_cached(cls, config_file):
+        config_file = config_file or os.environ["DEFAULT_CONFIG"]
+        if not cls.__options["cache"]:
+            return cls.__load_config(config_file, resolve_env=not cls.__options["lazy_env"])
+        entry = cls.__cache.get(config_file)
+        now = time.monotonic()
+        if entry is not None and now < entry.next_check:
+            return entry.config
+        with cls.__lock:
+            entry = cls.__cache.get(config_file)
+            mtime = cls.__mtime(config_file)
+            if entry is None or entry.mtime != mtime:
+                config = cls.__load_config(config_file, resolve_env=not cls.__options["lazy_env"])
+                entry = cls.__cache[config_file] = CachedConfig(mtime, config)
+            entry.next_check = now + cls.__options["check_interval"]
+            return entry.config
+
+    @staticmethod
+    def __mtime(filename):
+        try:
+            return os.stat(filename).st_mtime_ns
+        except OSError as e:
+            raise Exception("Error: Can't parse config file {}. {}".format(filename, str(e)))
 
     @staticmethod
-    def __load_config(filename):
+    def __load_config(filename, resolve_env=True):
         try:
             with open(filename) as f:
-                config = yaml.load(f, yaml.SafeLoader)
-            config = replace_env(config)
+                config = yaml.load(f, getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+            if resolve_env:
+                config = replace_env(config)
         except Exception as e:
             raise Exception("Error: Can't parse config file {}. {}".format(filename, str(e)))
         return config
 
 
+def copy_config(node, resolve_env=False):
+    if type(node) is dict:
+        return {k: copy_config(v, resolve_env) for k, v in node.items()}
+    if type(node) is list:
+        return [copy_config(v, resolve_env) for v in node]
+    if resolve_env and type(node) is str:
+        return replace_env_value(node)
+    return node
+
+
 def replace_env(d):
     for k, v in d.items():
         if type(v) is dict:
             d[k] = replace_env(v)
         elif type(v) is str:
-            env_var = find_env(v)
-            if env_var:
-                value = os.environ[env_var[2:-1]]
-                d[k] = v.replace(env_var, value)
+            d[k] = replace_env_value(v)
     return d
 
 
+def replace_env_value(v):
+    env_var = find_env(v)
+    if env_var:
+        value = os.environ[env_var[2:-1]]
+        return v.replace(env_var, value)
+    return v
+
+
 def find_env(s):
     start = s.find("${")
     if start < 0:
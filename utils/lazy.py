@@ -0,0 +1,37 @@
+import os
+import threading
+
+
+class LazyProxy:
+    # Stands in for an object that is expensive to build at import time (clients, connections...). The
+    # object is built on first use, and built again in forked children instead of sharing the parent's.
+    __slots__ = ("_factory", "_obj", "_pid", "_lock")
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._obj = self._factory()
+                    self._pid = os.getpid()
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __setitem__(self, key, value):
+        self._resolve()[key] = value
+
+    def __repr__(self):
+        if self._pid != os.getpid():
+            name = getattr(self._factory, "__name__", self._factory)
+            return "<LazyProxy of {}, not built yet>".format(name)
+        return repr(self._obj)
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ITEMS = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 60
+INVALIDATE_ALL = b"*"
+
+
+class LocalEntry:
+    __slots__ = ("values", "complete", "size", "expires_at")
+
+    def __init__(self, expires_at):
+        self.values = {}
+        self.complete = False  # Every field of the hash is cached, not only the ones asked for so far
+        self.size = 0
+        self.expires_at = expires_at
+
+
+class LocalCache:
+    # In-process LRU of deserialized hashes, kept in sync with writes of other processes by an invalidation
+    # listener. The TTL bounds staleness if invalidations are missed. Cached values are shared between
+    # callers, don't mutate them.
+    def __init__(self, max_items=DEFAULT_MAX_ITEMS, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.pid = os.getpid()
+        self.generation = 0  # Bumped on every invalidation, fetches that raced with one are not cached
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_items=config.get("max_items", DEFAULT_MAX_ITEMS),
+            max_bytes=config.get("max_bytes", DEFAULT_MAX_BYTES),
+            ttl=config.get("ttl", DEFAULT_TTL),
+        )
+
+    def _get_entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(name)
+            return None
+        self._entries.move_to_end(name)
+        return entry
+
+    def _remove(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def get_mapping(self, name):
+        with self._lock:
+            entry = self._get_entry(name)
+            if entry is None or not entry.complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.values
+
+    def get_values(self, name, keys):
+        with self._lock:
+            entry = self._get_entry(name)
+            values = entry.values if entry is not None else {}
+            found = {k: values[k] for k in keys if k in values}
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+
+    def put(self, name, values, size, generation, complete=False):
+        with self._lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+            entry = self._get_entry(name)
+            if entry is None or complete:
+                self._remove(name)
+                entry = self._entries[name] = LocalEntry(time.monotonic() + self.ttl)
+            entry.values.update(values)
+            entry.complete = entry.complete or complete
+            entry.size += size
+            self.size += size
+            while len(self._entries) > self.max_items or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, name):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "items": len(self._entries),
+                "bytes": self.size,
+            }
+
+
+def start_invalidation_listener(local_cache, client, channel=None, keyspace_db=None):
+    # Either a pub/sub channel the writers publish hash names to, or Redis keyspace notifications
+    # (needs notify-keyspace-events to include "Kgh" on the server)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+
+    def on_message(message):
+        name = message["channel"].split(b":", 1)[1] if keyspace_db is not None else message["data"]
+        if name == INVALIDATE_ALL:
+            local_cache.clear()
+        else:
+            local_cache.invalidate(name.decode("utf-8"))
+
+    def on_error(e, pubsub, thread):
+        # Invalidations were possibly missed while disconnected
+        print(f"Local cache invalidation listener failed: {e}")
+        local_cache.clear()
+        time.sleep(1)
+
+    if keyspace_db is not None:
+        pubsub.psubscribe(**{f"__keyspace@{keyspace_db}__:*": on_message})
+    else:
+        pubsub.subscribe(**{channel: on_message})
+    return pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=on_error)
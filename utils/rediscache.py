@@ -1,50 +1,133 @@
 import pickle
-import redis
 import copy
 import builtins
 import json
-
+import math
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from utils.clients import ClientRegistry, redis_client_name
 from utils.configmanager import ConfigManager
+from utils.localcache import INVALIDATE_ALL, LocalCache, start_invalidation_listener
 
 
 class RedisCache:
     __client = None
     __types_mapping = None
+    __local = None
+    __invalidation = None
+    __tagged_values = None
 
     @classmethod
-    def init_client(cls, config=ConfigManager.get_config_value("cache", "redis")):
-        cls.__client = cls.__client = redis.StrictRedis(
-            host=config["host"], port=config["port"], db=config["db"], password=config["password"]
-        )
+    def init_client(cls, config=None):
+        config = config or ConfigManager.get_config_value("cache", "redis")
+        cls.__client = ClientRegistry.redis("cache", config)
         cls.__types_mapping = cls.__name__ + "__types_mapping"
 
-    @classmethod
-    def __get_types_mapping(cls, name):
-        r = cls.get_client()
-        types_mapping = r.hget(name, cls.__types_mapping) or {}
-        if types_mapping:
-            types_mapping = pickle.loads(types_mapping)
-        return types_mapping
-
     @classmethod
     def get_client(cls):
         if not cls.__client:
             cls.init_client()
         return cls.__client
 
-    def set_mapping(self, name, mapping):
+    @classmethod
+    def init_tagged_values(cls, enabled=None):
+        # Readers understand both formats, but readers from before type tags fail on tagged values. Enable
+        # cache.tagged_values only once every process sharing the cache runs this version, until then values
+        # are written untagged along with the legacy __types_mapping blob.
+        if enabled is None:
+            enabled = ConfigManager.get_config_value("cache").get("tagged_values", False)
+        cls.__tagged_values = bool(enabled)
+        return cls.__tagged_values
+
+    @classmethod
+    def tagged_values(cls):
+        if cls.__tagged_values is None:
+            cls.init_tagged_values()
+        return cls.__tagged_values
+
+    @classmethod
+    def init_local_cache(cls, config=None):
+        # Optional in-process tier, configured under cache.local
+        config = config if config is not None else ConfigManager.get_config_value("cache").get("local")
+        if not config:
+            cls.__local = False
+            return None
+        cls.__local = LocalCache.from_config(config)
+        cls.__invalidation = config.get("invalidation", "pubsub")
+        client = cls.get_client()
+        if cls.__invalidation == "keyspace":
+            db = client.connection_pool.connection_kwargs.get("db", 0)
+            start_invalidation_listener(cls.__local, client, keyspace_db=db)
+        else:
+            start_invalidation_listener(cls.__local, client, channel=cls.invalidation_channel())
+        return cls.__local
+
+    @classmethod
+    def get_local_cache(cls):
+        # Listener threads don't survive forks, children start their own
+        if cls.__local is None or (cls.__local and cls.__local.pid != os.getpid()):
+            cls.init_local_cache()
+        return cls.__local or None
+
+    @classmethod
+    def local_cache_stats(cls):
+        local = cls.get_local_cache()
+        return local.stats() if local is not None else None
+
+    @classmethod
+    def invalidation_channel(cls):
+        return cls.__name__ + ":invalidate"
+
+    def _write(self, names, write):
+        # Other processes drop their local copies through the invalidation channel, published in the
+        # same round trip as the write. With keyspace notifications Redis does it on its own.
         r = self.get_client()
-        types_mapping = self.__get_types_mapping(name)
-        serialized = self.serialize_mapping(mapping, types_mapping)
-        result = r.hmset(name, serialized)
+        local = self.get_local_cache()
+        pipe = r.pipeline(transaction=False)
+        write(pipe)
+        if local is not None and self.__invalidation != "keyspace":
+            [pipe.publish(self.invalidation_channel(), name) for name in names]
+        result = pipe.execute()[0]
+        if local is not None:
+            [local.clear() if name == INVALIDATE_ALL else local.invalidate(name) for name in names]
         return result
 
+    def set_mapping(self, name, mapping):
+        if not mapping:
+            return True
+        if self.tagged_values():
+            serialized = self.serialize_mapping(mapping)
+            self._write([name], lambda pipe: pipe.hset(name, mapping=serialized))  # No type blob to update
+        else:
+            serialized = self.serialize_legacy_mapping(mapping, self.__get_types_mapping(name))
+            self._write([name], lambda pipe: pipe.hset(name, mapping=serialized))
+        return True
+
+    @classmethod
+    def __get_types_mapping(cls, name):
+        types_mapping = cls.get_client().hget(name, cls.__types_mapping)
+        return pickle.loads(types_mapping) if types_mapping else {}
+
     def get_mapping(self, name):
+        local = self.get_local_cache()
+        if local is not None:
+            mapping = local.get_mapping(name)
+            if mapping is not None:
+                return dict(mapping)
+            generation = local.generation
         r = self.get_client()
         mapping = r.hgetall(name)
         mapping = {k.decode("utf-8"): v for k, v in mapping.items()}
+        size = raw_size(mapping)
         if mapping:
             mapping = self.deserialize_mapping(mapping, deep_copy=False)
+        if local is not None:
+            local.put(name, mapping, size, generation, complete=True)
         return mapping
 
     def set_value(self, name, key, value):
@@ -55,41 +138,39 @@ class RedisCache:
         return values[0]
 
     def get_values(self, name, keys):
-        r = self.get_client()
-        values = r.hmget(name, *keys, self.__types_mapping)
-        keys.append(self.__types_mapping)
-        mapping = {k: v for k, v in zip(keys, values)}
-        if mapping:
+        local = self.get_local_cache()
+        found = {}
+        if local is not None:
+            found = local.get_values(name, keys)
+            generation = local.generation
+        missing = [k for k in keys if k not in found]
+        if missing:
+            r = self.get_client()
+            # The legacy type blob comes along in the same round trip, it's only unpickled for untagged values
+            *values, types_mapping = r.hmget(name, *missing, self.__types_mapping)
+            mapping = {k: v for k, v in zip(missing, values)}
+            size = raw_size(mapping)
+            mapping[self.__types_mapping] = types_mapping
             mapping = self.deserialize_mapping(mapping, deep_copy=False)
-        return list(mapping.values())
-
-    def __clean_types_mapping(self, name, keys):
-        r = self.get_client()
-        types_mapping = self.__get_types_mapping(name)
-        if types_mapping:
-            [types_mapping.pop(k) for k in keys if k in types_mapping]
-            r.hset(name, self.__types_mapping, pickle.dumps(types_mapping))
+            if local is not None:
+                local.put(name, mapping, size, generation)
+            found.update(mapping)
+        return [found[k] for k in keys]
 
     def delete_values(self, name, keys):
-        r = self.get_client()
-        self.__clean_types_mapping(name, keys)
-        return r.hdel(name, *keys)
+        return self._write([name], lambda pipe: pipe.hdel(name, *keys))
 
     def delete_value(self, name, key):
-        r = self.get_client()
-        self.__clean_types_mapping(name, [key])
-        return r.hdel(name, key)
+        return self.delete_values(name, [key])
 
     def delete_keys(self, names):
-        r = self.get_client()
-        return r.delete(*names)
+        return self._write(names, lambda pipe: pipe.delete(*names))
 
     def delete_key(self, name):
         return self.delete_keys([name])
 
     def clear(self):
-        r = self.get_client()
-        return r.flushdb()
+        return self._write([INVALIDATE_ALL], lambda pipe: pipe.flushdb())
 
     def exists(self, name):
         r = self.get_client()
@@ -102,11 +183,14 @@ class RedisCache:
     def get_all_keys_in_mapping(self, name):
         r = self.get_client()
         keys = [k.decode("utf-8") for k in r.hkeys(name)]
-        keys.remove(self.__types_mapping)
-        return keys
+        return [k for k in keys if k != self.__types_mapping]
 
     @classmethod
-    def serialize_mapping(cls, mapping, types_mapping):
+    def serialize_mapping(cls, mapping):
+        return {k: encode_value(v) for k, v in mapping.items()}
+
+    @classmethod
+    def serialize_legacy_mapping(cls, mapping, types_mapping):
         serialized = {}
         for k, v in mapping.items():
             if should_pickle(v):
@@ -120,14 +204,63 @@ class RedisCache:
 
     @classmethod
     def deserialize_mapping(cls, mapping, deep_copy=True):
-        types_mapping = pickle.loads(mapping.pop(cls.__types_mapping))
+        # Hashes written before type tags keep the types of their values in a pickled __types_mapping field
+        types_blob = mapping.pop(cls.__types_mapping, None)
         deserialized = copy.deepcopy(mapping) if deep_copy else mapping.copy()
-        for k in deserialized:
+        types_mapping = None
+        for k, v in deserialized.items():
+            if v is None or v.startswith(TAG_PREFIX):
+                deserialized[k] = decode_value(v)
+                continue
+            if types_mapping is None:
+                types_mapping = pickle.loads(types_blob) if types_blob else {}
             if k in types_mapping:
-                deserialized[k] = coerce_obj(deserialized[k], types_mapping[k])
+                deserialized[k] = coerce_obj(v, types_mapping[k])
         return deserialized
 
 
+cache_types = [str, int, bytes, float]
+should_pickle = lambda x: type(x) not in cache_types
+
+
+# Values are stored as TAG_PREFIX + a one byte type tag + the value. The prefix starts with a byte that
+# can't start an UTF-8 string nor a pickle, so tagged values never clash with legacy untagged ones.
+TAG_PREFIX = b"\xffRC"
+TAGS = {str: b"s", int: b"i", float: b"f", bytes: b"b"}
+PICKLED_TAG = b"p"
+TAG_TYPES = {tag: _type for _type, tag in TAGS.items()}
+TAG_OFFSET = len(TAG_PREFIX)
+
+
+def encode_value(value):
+    if should_pickle(value):
+        return TAG_PREFIX + PICKLED_TAG + pickle.dumps(value)
+    _type = type(value)
+    if _type is bytes:
+        return TAG_PREFIX + TAGS[bytes] + value
+    if _type is str:
+        return TAG_PREFIX + TAGS[str] + value.encode("utf-8")
+    return TAG_PREFIX + TAGS[_type] + repr(value).encode("utf-8")
+
+
+def decode_value(raw):
+    if raw is None:
+        return None
+    tag, payload = raw[TAG_OFFSET : TAG_OFFSET + 1], raw[TAG_OFFSET + 1 :]
+    if tag == PICKLED_TAG:
+        return pickle.loads(payload)
+    _type = TAG_TYPES[tag]
+    if _type is bytes:
+        return payload
+    if _type is str:
+        return payload.decode("utf-8")
+    return _type(payload)
+
+
+def raw_size(mapping):
+    return sum(len(k) + len(v or b"") for k, v in mapping.items())
+
+
 ignore_coercion = [bytes.__name__]
 
 
@@ -142,43 +275,214 @@ def coerce_obj(obj, type_name):
     return _type(obj)
 
 
-cache_types = [str, int, bytes, float]
-should_pickle = lambda x: type(x) not in cache_types
+Serializer = namedtuple("Serializer", ["dumps", "loads"])
+
+
+def _msgpack_serializer():
+    import msgpack
+
+    return Serializer(lambda x: msgpack.packb(x, use_bin_type=True), lambda b: msgpack.unpackb(b, raw=False))
+
+
+SERIALIZERS = {
+    "pickle": lambda: Serializer(pickle.dumps, pickle.loads),
+    "json": lambda: Serializer(lambda x: json.dumps(x).encode("utf-8"), json.loads),
+    "msgpack": _msgpack_serializer,
+}
+
+
+def get_serializer(serializer):
+    return SERIALIZERS[serializer]() if isinstance(serializer, str) else serializer
+
+
+def default_key_builder(name, key, *args, **kwargs):
+    return name + "-" + str(key)
+
+
+def args_key_builder(name, *args, **kwargs):
+    parts = [str(arg) for arg in args] + ["%s=%s" % item for item in sorted(kwargs.items())]
+    return "-".join([name] + parts)
+
+
+LOCK_POLL_INTERVAL = 0.05
+
 
+# Cached values are stored as [value, seconds it took to compute, logical expiry timestamp]. The key lives
+# stale_ttl seconds longer than timeout so stale values can be served while they are recomputed.
+# Entries live under name + ENTRY_VERSION: decorators from before the envelope store the bare result under
+# name-key and would return an envelope found there as is. Invalidations delete both keys.
+ENTRY_VERSION = ":v2"
+
+
+def entry_names(key_builder, name, *args, **kwargs):
+    return [key_builder(name + ENTRY_VERSION, *args, **kwargs), key_builder(name, *args, **kwargs)]
+def _load_entry(serializer, raw):
+    if raw is None:
+        return None
+    try:
+        entry = serializer.loads(raw)
+    except Exception:
+        return None  # Written by another serializer or before entries had a format, recompute it
+    return entry if isinstance(entry, (list, tuple)) and len(entry) == 3 else None
+
+
+def redis_cachable(
+    r,
+    name,
+    timeout=120,
+    serializer="pickle",
+    key_builder=default_key_builder,
+    beta=1.0,
+    lock_timeout=None,
+    stale_ttl=0,
+):
+    # beta: probabilistic early expiration (XFetch), slow functions are recomputed sooner, 0 disables it.
+    # lock_timeout: on a miss only one caller computes, the others wait up to lock_timeout for its result.
+    # stale_ttl: expired values are served for this long while one caller refreshes them in the background.
+    serializer = get_serializer(serializer)
+    entry_name = name + ENTRY_VERSION
 
-def redis_cachable(r, name, timeout=120):
     def _set_name(f):
-        def _redis_cachable(key, *args, **kwargs):
-            key_name = name + "-" + key
-            if r.exists(key_name):
-                result = r.get(key_name)
-            else:
-                result = f(key, *args, **kwargs)
-                r.set(key_name, result, ex=timeout)
+        def compute(key_name, args, kwargs):
+            start = time.time()
+            result = f(*args, **kwargs)
+            now = time.time()
+            entry = serializer.dumps([result, now - start, now + timeout])
+            r.set(key_name, entry, px=int((timeout + stale_ttl) * 1000))
             return result
 
+        def compute_locked(key_name, args, kwargs):
+            # Returns whether this caller got the lock and computed the value, and the value
+            lock_name = key_name + ":lock"
+            if not r.set(lock_name, 1, nx=True, px=int((lock_timeout or timeout) * 1000)):
+                return False, None
+            try:
+                return True, compute(key_name, args, kwargs)
+            finally:
+                r.delete(lock_name)
+
+        refreshing = set()  # Keys this process is refreshing, hits on them meanwhile don't start more threads
+        refreshing_lock = threading.Lock()
+
+        def refresh(key_name, args, kwargs):
+            try:
+                compute_locked(key_name, args, kwargs)
+            except Exception as e:
+                print(f"Can't refresh cached {key_name}: {e}")
+            finally:
+                with refreshing_lock:
+                    refreshing.discard(key_name)
+
+        def start_refresh(key_name, args, kwargs):
+            with refreshing_lock:
+                if key_name in refreshing:
+                    return
+                refreshing.add(key_name)
+            threading.Thread(target=refresh, args=(key_name, args, kwargs), daemon=True).start()
+
+        def wait_for_value(key_name):
+            deadline = time.time() + lock_timeout
+            while time.time() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = _load_entry(serializer, r.get(key_name))
+                if entry is not None:
+                    return entry
+            return None
+
+        @wraps(f)
+        def _redis_cachable(*args, **kwargs):
+            key_name = key_builder(entry_name, *args, **kwargs)
+            entry = _load_entry(serializer, r.get(key_name))
+            if entry is not None:
+                value, delta, expires_at = entry
+                now = time.time()
+                if now >= expires_at:
+                    if stale_ttl:
+                        start_refresh(key_name, args, kwargs)
+                        return value
+                elif not beta or now - delta * beta * math.log(random.random()) < expires_at:
+                    return value
+                return compute(key_name, args, kwargs)
+            if lock_timeout:
+                computed, result = compute_locked(key_name, args, kwargs)
+                if computed:
+                    return result
+                entry = wait_for_value(key_name)
+                if entry is not None:
+                    return entry[0]
+            return compute(key_name, args, kwargs)
+
+        def invalidate(*args, **kwargs):
+            return r.delete(*entry_names(key_builder, name, *args, **kwargs))
+
+        _redis_cachable.invalidate = invalidate
         return _redis_cachable
 
     return _set_name
 
 
-def invalidate_key(r, name):
+def redis_cachable_many(r, name, timeout=120, serializer="pickle", key_builder=default_key_builder):
+    # For f(keys, *args, **kwargs) returning one value per key, in order. Cached keys are read with a single
+    # MGET, f only gets the missing ones. Entries are shared with redis_cachable using the same name.
+    serializer = get_serializer(serializer)
+    entry_name = name + ENTRY_VERSION
+
     def _set_name(f):
-        def _invalidate_key(key, *args, **kwargs):
-            key_name = name + "-" + key
-            r.delete(key_name)
-            return f(key, *args, **kwargs)
+        @wraps(f)
+        def _redis_cachable_many(keys, *args, **kwargs):
+            if not keys:
+                return []
+            key_names = [key_builder(entry_name, key, *args, **kwargs) for key in keys]
+            entries = [_load_entry(serializer, raw) for raw in r.mget(key_names)]
+            results = [entry[0] if entry is not None else None for entry in entries]
+            missing = [i for i, entry in enumerate(entries) if entry is None]
+            if missing:
+                computed = f([keys[i] for i in missing], *args, **kwargs)
+                expires_at = time.time() + timeout
+                pipe = r.pipeline(transaction=False)
+                for i, value in zip(missing, computed):
+                    results[i] = value
+                    pipe.set(key_names[i], serializer.dumps([value, 0, expires_at]), px=int(timeout * 1000))
+                pipe.execute()
+            return results
+
+        return _redis_cachable_many
+
+    return _set_name
+
+
+def invalidate_key(r, name, key_builder=default_key_builder):
+    def _set_name(f):
+        @wraps(f)
+        def _invalidate_key(*args, **kwargs):
+            key_names = entry_names(key_builder, name, *args, **kwargs)
+            r.delete(*key_names)
+            result = f(*args, **kwargs)
+            r.delete(*key_names)  # Readers running between both deletes may have cached the old value again
+            return result
 
         return _invalidate_key
 
     return _set_name
 
 
+def invalidate_keys(r, name, key_builder=default_key_builder):
+    def _set_name(f):
+        @wraps(f)
+        def _invalidate_keys(keys, *args, **kwargs):
+            key_names = [n for key in keys for n in entry_names(key_builder, name, key, *args, **kwargs)]
+            if key_names:
+                r.delete(*key_names)
+            result = f(keys, *args, **kwargs)
+            if key_names:
+                r.delete(*key_names)
+            return result
+
+        return _invalidate_keys
+
+    return _set_name
+
+
 def make_redis(redis_config):
-    return redis.StrictRedis(
-        host=redis_config["host"],
-        port=redis_config["port"],
-        db=redis_config["db"],
-        password=redis_config["password"],
-    )
+    return ClientRegistry.redis(redis_client_name(redis_config), redis_config)
 